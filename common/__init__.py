@@ -1,6 +1,21 @@
 from .config import *
+from .session_ids import *
+from .registry import *
+from .stand_in import *
+from .stats import *
+from .metrics import *
 from .connection import *
 from .util import *
 from .error_codes import *
 from .authorization_module import *
+from .connections_mirror import *
+from .notifications import *
 from .group import *
+from .pool import *
+from .log_sink import *
+from .proc_sampler import *
+from .deploy import *
+from .controller import *
+from .load import *
+from .leak import *
+from .soak import *
@@ -1,3 +1,5 @@
+from typing import List, Dict, Optional, Iterator, Set
+
 from pydantic import BaseModel, Field
 
 
@@ -14,3 +16,118 @@ class AuthConnectionsInfo(BaseModel):
     this: bool = Field(..., alias="self")
     auth_from: int = Field(..., alias="authFrom")
     user: AuthConnectionsInfoUser = Field(..., alias="user")
+
+
+class ConnectionsSnapshotDiff:
+    def __init__(self, added: List[int], removed: List[int]):
+        """ Разница двух снимков: uid появившихся и пропавших соединений """
+        self.added = added
+        self.removed = removed
+
+    def __bool__(self):
+        return bool(self.added or self.removed)
+
+
+class ConnectionsSnapshot:
+    def __init__(self, raw: List[dict], validate: bool = False):
+        """
+        Снимок результата Auth.Connections.list
+
+        Ответ разбирается один раз: индексы по uid, группе, пользователю и роли строятся
+        по сырым словарям при первом обращении, модели AuthConnectionsInfo создаются только для
+        выданных элементов (и кэшируются). validate=True - проверить все элементы сразу
+        """
+        self.raw = raw
+        self._models: Dict[int, AuthConnectionsInfo] = {}
+        self._by_uid: Optional[Dict[int, dict]] = None
+        self._by_group: Dict[int, List[int]] = {}
+        self._by_user: Dict[str, List[int]] = {}
+        self._by_role: Dict[str, List[int]] = {}
+        self._this: Optional[int] = None
+        if validate:
+            for uid in self._index():
+                self._model(uid)
+
+    @classmethod
+    async def fetch(cls, connect, validate: bool = False) -> "ConnectionsSnapshot":
+        """ Запросить Auth.Connections.list через connect (Connection) """
+        return cls(await connect.rpc("Auth.Connections.list"), validate)
+
+    def _index(self) -> Dict[int, dict]:
+        if self._by_uid is None:
+            self._by_uid = {}
+            for info in self.raw:
+                uid = info["uid"]
+                self._by_uid[uid] = info
+                self._by_group.setdefault(info["groupId"], []).append(uid)
+                self._by_user.setdefault(info["user"]["name"], []).append(uid)
+                self._by_role.setdefault(info["user"]["role"], []).append(uid)
+                if info["self"]:
+                    self._this = uid
+        return self._by_uid
+
+    def _model(self, uid: int) -> AuthConnectionsInfo:
+        model = self._models.get(uid)
+        if model is None:
+            model = self._models[uid] = AuthConnectionsInfo(**self._index()[uid])
+        return model
+
+    def _models_of(self, uids: List[int]) -> List[AuthConnectionsInfo]:
+        return [self._model(uid) for uid in uids]
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def __iter__(self) -> Iterator[AuthConnectionsInfo]:
+        return iter(self._models_of(list(self._index())))
+
+    def __contains__(self, uid: int) -> bool:
+        return uid in self._index()
+
+    @property
+    def uids(self) -> Set[int]:
+        return set(self._index())
+
+    @property
+    def this(self) -> Optional[AuthConnectionsInfo]:
+        """ Соединение, через которое сделан запрос (self == True) """
+        self._index()
+        return None if self._this is None else self._model(self._this)
+
+    def by_uid(self, uid: int) -> Optional[AuthConnectionsInfo]:
+        return self._model(uid) if uid in self._index() else None
+
+    def by_group(self, group_id: int) -> List[AuthConnectionsInfo]:
+        self._index()
+        return self._models_of(self._by_group.get(group_id, []))
+
+    def by_user(self, name: str) -> List[AuthConnectionsInfo]:
+        self._index()
+        return self._models_of(self._by_user.get(name, []))
+
+    def by_role(self, role: str) -> List[AuthConnectionsInfo]:
+        self._index()
+        return self._models_of(self._by_role.get(role, []))
+
+    def count_group(self, group_id: int) -> int:
+        self._index()
+        return len(self._by_group.get(group_id, []))
+
+    def count_user(self, name: str) -> int:
+        self._index()
+        return len(self._by_user.get(name, []))
+
+    def count_role(self, role: str) -> int:
+        self._index()
+        return len(self._by_role.get(role, []))
+
+    def group_id_of(self, name: str) -> Optional[int]:
+        """ groupId первого соединения пользователя name """
+        self._index()
+        uids = self._by_user.get(name)
+        return self._by_uid[uids[0]]["groupId"] if uids else None
+
+    def diff(self, newer: "ConnectionsSnapshot") -> ConnectionsSnapshotDiff:
+        """ Что изменилось в newer относительно этого снимка """
+        old, new = self.uids, newer.uids
+        return ConnectionsSnapshotDiff(added=sorted(new - old), removed=sorted(old - new))
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -18,6 +18,15 @@ class Service(BaseModel):
     config: Path = Field(..., alias="config")
     port: int = Field(..., alias="port")
     param_key: str = Field(..., alias="paramKey")
+    # function - развертывание и запуск сервиса на каждый тест,
+    # session - один запуск на всю сессию, между тестами сброс состояния (Controller.reset)
+    scope: str = Field("function", alias="scope")
+    # process - запуск auth_service (execute), stand_in - заменитель сервиса в процессе теста (StandInAuthService)
+    mode: str = Field("process", alias="mode")
+    # ротация log_stdout.txt/log_stderr.txt по размеру, None - без ротации
+    log_max_bytes: Optional[int] = Field(None, alias="logMaxBytes")
+    # период опроса /proc процесса сервиса (ProcSampler), сек, None - не опрашивать
+    sample_interval: Optional[float] = Field(None, alias="sampleInterval")
 
 
 class DefaultUser(BaseModel):
@@ -34,6 +43,13 @@ class User(BaseModel):
 class Data(BaseModel):
     default_user: DefaultUser = Field(..., alias="defaultUser")
     users: List[User] = Field(..., alias="users")
+    # сколько пользователей сгенерировать в БД-шаблон по образцу каждого из users (Controller.prepare_template)
+    population: int = Field(0, alias="population")
+
+    def generated_users(self) -> List[User]:
+        """ Пользователи БД-шаблона: <name>-<номер>, пароль и роль - как у образца """
+        return [User(name=f"{user.name}-{i}", password=user.password, role=user.role)
+                for user in self.users for i in range(self.population)]
 
 
 class Config(BaseModel):
@@ -44,3 +60,13 @@ class Config(BaseModel):
     service: Service = Field(..., alias="service")
     work_dir: Path = Field(..., alias="workDir")
     data: Data = Field(..., alias="data")
+
+    def for_worker(self, worker_id: str, port: int) -> "Config":
+        """
+        Конфиг для параллельного запуска (pytest-xdist): у каждого воркера свой экземпляр сервиса
+        на своем порту и своя рабочая дирректория <workDir>/<worker_id>
+        """
+        config = self.copy(deep=True)
+        config.service.port = port
+        config.work_dir = self.work_dir.joinpath(worker_id)
+        return config
@@ -1,54 +1,169 @@
-from typing import Optional, List
+import asyncio
+from typing import Optional, List, Union, Iterable, Sequence, Any, Dict
 
 from bolid_jsonrpc import JsonRpcClientBase, tcp_json_rpc_client, JsonRpcHandshakeParam, auth_login
 
+from common.session_ids import SessionIdAllocator
+from common.registry import ConnectionRegistry
+from common.metrics import RpcMetrics, InstrumentedRpc
+from common.stand_in import StandInAuthService
+
+
+class CallResult:
+    def __init__(self, method: str, args: Sequence, result: Any = None, error: Optional[Exception] = None):
+        """ Результат одного вызова из Connection.batch """
+        self.method = method
+        self.args = args
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def value(self) -> Any:
+        """ Результат вызова, при ошибке - исключение вызова """
+        if self.error is not None:
+            raise self.error
+        return self.result
+
 
 class Connection:
-    ALL_CONNECTS: List[JsonRpcClientBase] = []
+    REGISTRY: ConnectionRegistry = ConnectionRegistry()  # открытые клиенты по областям (тест, сессия)
+    SESSION_IDS: SessionIdAllocator = SessionIdAllocator()
+    METRICS: Optional[RpcMetrics] = None  # статистика вызовов rpc, None - выключена
+    STAND_IN: Optional[StandInAuthService] = None  # заменитель сервиса в процессе (service.mode == "stand_in")
 
-    def __init__(self, session: int):
+    def __init__(self, session: Optional[int] = None, kind: str = "user"):
         """
-        :param session: - для пользователей от 3000 до 4000
-        для сервисного подключения - 1 до 3000
-        для админа c 3000
+        :param session: - диапазоны SessionIdAllocator.RANGES: сервисное подключение 1 - 2999,
+        админ 3000 - 3099, пользователи 3100 - 4000 (под xdist - поддиапазон воркера).
+        None - выдать свободный идентификатор из диапазона kind (SESSION_IDS), заданный вручную не должен быть занят
+        :param kind: - диапазон идентификатора: service, admin, user
         """
+        if session is None:
+            session = Connection.SESSION_IDS.allocate(kind)
+        else:
+            Connection.SESSION_IDS.reserve(session)
         self.id_session: Optional[int] = None
-        self.rpc: Optional[JsonRpcClientBase] = None
+        self.client: Optional[JsonRpcClientBase] = None
+        self.rpc: Optional[Union[JsonRpcClientBase, InstrumentedRpc]] = None  # client или его обертка (METRICS)
         self.name: Optional[str] = None
         self.session: Optional[int] = session
         self.token: Optional[str] = None
 
     async def start(self, port: int):
         """ Создать соединение """
-        _connect = tcp_json_rpc_client('127.0.0.1',
-                                       port,
-                                       handshake=JsonRpcHandshakeParam(  # рукопожатие
-                                           client_id=self.session,
-                                           host='localhost',
-                                           user_agent='internal', )
-                                       )
-        conn = await _connect.connect()
-        self.rpc = _connect
-        Connection.ALL_CONNECTS.append(_connect)
-        return conn
+        if Connection.STAND_IN is not None:
+            _connect = Connection.STAND_IN.client(self.session, 'localhost', 'internal')
+        else:
+            _connect = tcp_json_rpc_client('127.0.0.1',
+                                           port,
+                                           handshake=JsonRpcHandshakeParam(  # рукопожатие
+                                               client_id=self.session,
+                                               host='localhost',
+                                               user_agent='internal', )
+                                           )
+        # клиент запоминается до рукопожатия: прерванный (отмена, таймаут) start закрывается через stop
+        self.client = _connect
+        self.rpc = _connect if Connection.METRICS is None else InstrumentedRpc(_connect, Connection.METRICS)
+        Connection.REGISTRY.add(_connect)
+        return await _connect.connect()
 
     async def stop(self):
-        """ Разрыв соединения """
-        await self.rpc.stop()
-        Connection.ALL_CONNECTS.remove(self.rpc)
+        """ Разрыв соединения, идентификатор сессии освобождается и при ошибке (в том числе если start не удался) """
+        try:
+            if self.client is not None:
+                await self.client.stop()
+        finally:
+            Connection.REGISTRY.discard(self.client)
+            Connection.SESSION_IDS.release(self.session)
 
     # вспомогательные методы обертки над rpc
     async def login(self, user_name: str, user_password: str):
         self.name = user_name
-        self.token = await auth_login(
-            self.rpc,
-            user_name,
-            user_password,
-        )  # После логина внутреннее состояние объекта rpc изменится
+        if Connection.STAND_IN is not None:
+            login = self.client.auth_login(user_name, user_password)
+        else:
+            login = auth_login(
+                self.client,
+                user_name,
+                user_password,
+            )  # После логина внутреннее состояние объекта rpc изменится
+        self.token = await (login if Connection.METRICS is None else Connection.METRICS.measure("auth_login", login))
         return self.token
 
+    async def batch(self, calls: Iterable[Sequence], window: int = 64) -> List[CallResult]:
+        """
+        Выполнить много вызовов конвейером: до window запросов одновременно в полете по одному соединению
+        :param calls: - [(method, *args), ...]
+        :return: - результаты в порядке calls, ошибки не выбрасываются - в CallResult.error
+        """
+        semaphore = asyncio.Semaphore(window)
+
+        async def _call(method: str, *args) -> CallResult:
+            async with semaphore:
+                try:
+                    return CallResult(method, args, result=await self.rpc(method, *args))
+                except Exception as ex:
+                    return CallResult(method, args, error=ex)
+
+        return await asyncio.gather(*[_call(*call) for call in calls])
+
     async def restore(self):
         # авторизация(токен)
         await self.login("Auth.Session.restore", self.token)
         # whoami получить userName
         await self.rpc("Auth.User.whoami")
+
+
+def _abort(client: JsonRpcClientBase):
+    """
+    Закрыть соединение клиента немедленно, без обмена с сервисом: abort() клиента, если есть,
+    иначе abort() его транспорта asyncio
+    """
+    abort = getattr(client, "abort", None)
+    if abort is None:
+        transport = getattr(client, "transport", None) or getattr(client, "_transport", None)
+        abort = getattr(transport, "abort", None)
+    if abort is not None:
+        try:
+            abort()
+        except Exception:
+            pass
+
+
+async def close_clients(clients: Iterable[JsonRpcClientBase], concurrency: int = 64,
+                        timeout: float = 10) -> Dict[str, int]:
+    """
+    Закрыть клиентов параллельно (не более concurrency одновременно) с общим сроком timeout сек:
+    не закрывшиеся к сроку (зависший сокет) прерываются отменой stop, их сокет закрывается abort
+    :return: - {"closed": закрыто, "failed": stop с ошибкой, "forced": прервано по сроку}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"closed": 0, "failed": 0, "forced": 0}
+
+    async def _stop(client: JsonRpcClientBase):
+        async with semaphore:
+            try:
+                await client.stop()
+                stats["closed"] += 1
+            except Exception:
+                stats["failed"] += 1
+
+    clients = list(clients)
+    tasks = [asyncio.ensure_future(_stop(client)) for client in clients]
+    if not tasks:
+        return stats
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending, timeout=1)  # stop, не реагирующий на отмену, не ждем
+    # отмененный stop мог оставить сокет открытым
+    for client, task in zip(clients, tasks):
+        if task in pending:
+            _abort(client)
+    stats["forced"] = len(pending)
+    return stats
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Callable, Set, Tuple
+
+from common import Connection, AuthConnectionsInfo, ConnectionsSnapshot, LatencyHistogram
+
+__all__ = [
+    "ConnectionsMirror",
+]
+
+EVENT_UP = "Auth.Connections.Event.Up"
+EVENT_DOWN = "Auth.Connections.Event.Down"
+
+
+class ConnectionsMirror:
+    def __init__(self, connect: Connection):
+        """
+        Локальная копия Auth.Connections.list, которую видит авторизованное соединение connect
+
+        start - подписка Auth.Connections.watch и один запрос list, дальше копия обновляется
+        уведомлениями Event.Up / Event.Down без запросов к сервису.
+        wait_until - дождаться условия над копией, sync - сверка с list и время сходимости копии (convergence)
+        """
+        self.connect = connect
+        self.connections: Dict[int, AuthConnectionsInfo] = {}
+        self.convergence = LatencyHistogram()  # sync: от ответа list до совпадения копии, сек
+        self._by_group: Dict[int, Set[int]] = {}
+        self._by_user: Dict[str, Set[int]] = {}
+        self._pending: Optional[List[Tuple[str, object]]] = None
+        self._waiters: List[Tuple[Callable[["ConnectionsMirror"], bool], asyncio.Future]] = []
+        self._active = False
+        self._registered = False
+
+    async def start(self) -> "ConnectionsMirror":
+        if not self._registered:
+            self.connect.rpc.register_notification_trap(self._on_event, {EVENT_UP: AuthConnectionsInfo})
+            self.connect.rpc.register_notification_trap(self._on_event, {EVENT_DOWN: List[int]})
+            self._registered = True
+        # уведомления, пришедшие до ответа list, применяются поверх него
+        self._pending = []
+        self._active = True
+        subscribed = await self.connect.rpc("Auth.Connections.watch", True)
+        if subscribed is not True:
+            self._active = False
+            self._pending = None
+            raise RuntimeError(f"Auth.Connections.watch(true) вернул {subscribed!r}")
+        snapshot = await ConnectionsSnapshot.fetch(self.connect)
+        self._clear()
+        for info in snapshot:
+            self._add(info)
+        pending, self._pending = self._pending, None
+        for name, data in pending:
+            self._apply(name, data)
+        self._notify_waiters()
+        return self
+
+    async def stop(self):
+        """ Отписаться от уведомлений, незавершенные wait_until получат CancelledError """
+        self._active = False
+        for _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+        await self.connect.rpc("Auth.Connections.watch", False)
+
+    def _clear(self):
+        self.connections.clear()
+        self._by_group.clear()
+        self._by_user.clear()
+
+    def _add(self, info: AuthConnectionsInfo):
+        if info.uid in self.connections:
+            self._remove(info.uid)
+        self.connections[info.uid] = info
+        self._by_group.setdefault(info.group_id, set()).add(info.uid)
+        self._by_user.setdefault(info.user.name, set()).add(info.uid)
+
+    def _remove(self, uid: int):
+        info = self.connections.pop(uid, None)
+        if info is None:
+            return
+        self._by_group[info.group_id].discard(uid)
+        self._by_user[info.user.name].discard(uid)
+
+    def _apply(self, name: str, data):
+        if name == EVENT_UP:
+            self._add(data)
+        else:
+            for uid in data:
+                self._remove(uid)
+
+    def _on_event(self, name: str, data):
+        if not self._active:
+            return
+        if self._pending is not None:
+            self._pending.append((name, data))
+            return
+        self._apply(name, data)
+        self._notify_waiters()
+
+    def _notify_waiters(self):
+        waiters = []
+        for predicate, future in self._waiters:
+            if future.done():
+                continue
+            if predicate(self):
+                future.set_result(True)
+            else:
+                waiters.append((predicate, future))
+        self._waiters = waiters
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    @property
+    def uids(self) -> Set[int]:
+        return set(self.connections)
+
+    def count_group(self, group_id: int) -> int:
+        return len(self._by_group.get(group_id, ()))
+
+    def count_user(self, name: str) -> int:
+        return len(self._by_user.get(name, ()))
+
+    async def wait_until(self, predicate: Callable[["ConnectionsMirror"], bool], timeout: float):
+        """ Дождаться predicate(mirror) == True, иначе asyncio.TimeoutError """
+        if predicate(self):
+            return
+        future = asyncio.get_event_loop().create_future()
+        self._waiters.append((predicate, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        finally:
+            if not future.done():
+                future.cancel()
+
+    async def wait_group_empty(self, group_id: int, timeout: float):
+        await self.wait_until(lambda mirror: mirror.count_group(group_id) == 0, timeout)
+
+    async def wait_user_empty(self, name: str, timeout: float):
+        await self.wait_until(lambda mirror: mirror.count_user(name) == 0, timeout)
+
+    async def sync(self, timeout: float) -> float:
+        """
+        Сверить копию с Auth.Connections.list: дождаться совпадения набора uid.
+        Вернет время сходимости (сек от ответа list до совпадения), оно же пишется в convergence.
+        Это не задержка доставки уведомлений: уведомления, пришедшие до ответа list, в него не входят
+        """
+        snapshot = await ConnectionsSnapshot.fetch(self.connect)
+        begin = time.perf_counter()
+        expected = snapshot.uids
+        await self.wait_until(lambda mirror: mirror.connections.keys() == expected, timeout)
+        convergence = time.perf_counter() - begin
+        self.convergence.record(convergence)
+        return convergence
@@ -0,0 +1,344 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional, Tuple, List
+
+from common import Config, User, Connection, LogSink, StandInAuthService, DeployCache, clone_file, read_json_config, \
+    write_json_config, ProcSampler
+
+__all__ = [
+    "Controller",
+]
+
+
+class Controller:
+    def __init__(self, config: Config):
+        """
+        Выполняет развертывание и запуск приложения
+
+        конструктор инициализирует конфиг теста
+        deploy	Копирование конфига и файла БД
+        path_config до настройки конфига
+        run запуск программы
+        prepare_template подготовка БД-шаблона с пользователями data.population
+        wait_ready ожидание готовности (рукопожатие на порт сервиса)
+        reset возврат сервиса в исходное состояние между тестами
+        sampler опрос /proc процесса сервиса (service.sampleInterval)
+        """
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.logger = None
+        self.tasks_read_task = None
+        self.timer = 1
+        self.config = config
+        self._db_state: Optional[Tuple] = None
+        self.stand_in: Optional[StandInAuthService] = None  # при service.mode == "stand_in"
+        self.template_db: Optional[Path] = None  # БД-шаблон с пользователями data.population
+        self._seed_users: List[User] = []
+        self.sampler: Optional[ProcSampler] = None  # опрос /proc запущенного процесса
+
+        # параметры проверки готовности (wait_ready)
+        self.probe_session: int = 3999  # идентификатор клиента для пробного рукопожатия
+        self.ready_timeout: float = 30
+        self.ready_first_delay: float = 0.05
+        self.ready_max_delay: float = 1
+        self.ready_times: List[float] = []  # время до готовности каждого запуска, сек
+
+    @property
+    def is_stand_in(self) -> bool:
+        return self.config.service.mode == "stand_in"
+
+    @property
+    def work_app_config(self) -> Path:
+        """ Путь до пропатченного конфига приложения в рабочей дирректории """
+        return self.config.work_dir.joinpath(self.config.service.config.name)
+
+    @property
+    def work_db(self) -> Path:
+        """ Путь до БД в рабочей дирректории """
+        return Path.cwd().joinpath(self.config.work_dir, self.config.service.db.name)
+
+    @property
+    def pristine_db(self) -> Path:
+        """ Исходная БД для каждого запуска: шаблон, если подготовлен, иначе service.db """
+        return self.template_db or self.config.service.db
+
+    def _copy_artifacts(self, to_folder_path: str):
+        """
+        Копировать артефакты
+        """
+        check_file = Path(to_folder_path).is_dir()  # проверить существует ли папка
+
+        if not check_file:  # если ее нет, создать
+            os.makedirs(to_folder_path)
+
+        # исполняемый файл и конфиг копируются, только если изменились
+        cache = DeployCache(Path(to_folder_path))
+        cache.sync(self.config.service.execute)  # добавить исполняемый файл в work_dir
+
+        # патч до конфига который нужно перенести
+        cache.sync(self.config.service.config)  # добавить конфигурацию приложения в work_dir
+
+        self._restore_db()  # добавить файл базы данных в work_dir
+
+    def _restore_db(self):
+        """
+        Подменить БД рабочей дирректории исходной (вместе с журналами sqlite).
+        Исходная БД - шаблон: копия через reflink, где файловая система поддерживает
+        """
+        for suffix in ("-wal", "-shm", "-journal"):
+            journal = self.work_db.with_name(self.work_db.name + suffix)
+            if journal.exists():
+                journal.unlink()
+        clone_file(self.pristine_db, self.work_db)
+        pristine_wal = self.pristine_db.with_name(self.pristine_db.name + "-wal")
+        if pristine_wal.exists():
+            clone_file(pristine_wal, self.work_db.with_name(self.work_db.name + "-wal"))
+
+    def _template_key(self, users: List[User]) -> str:
+        """ Хэш описания шаблона: исходная БД (путь, размер, время) и список пользователей """
+        stat = self.config.service.db.stat()
+        spec = {
+            "db": [str(self.config.service.db), stat.st_size, stat.st_mtime_ns],
+            "users": [[user.name, user.password, user.role] for user in users],
+        }
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("UTF-8")).hexdigest()[:16]
+
+    async def _seed_template(self, template: Path, users: List[User], concurrency: int):
+        """ Запустить сервис на исходной БД, создать пользователей, сохранить БД как шаблон """
+        self._restore_db()
+        try:
+            await self.start()
+            await self.wait_ready()
+
+            admin = Connection(kind="admin")
+            await admin.start(self.config.service.port)
+            try:
+                await admin.login(self.config.data.default_user.name, self.config.data.default_user.password)
+                results = await admin.batch([("Auth.User.create", user.name, user.password, user.role)
+                                             for user in users], window=concurrency)
+            finally:
+                await admin.stop()
+        finally:
+            await self._terminate()
+
+        # ошибка создания пользователя - шаблон не сохраняется
+        errors = [result for result in results if result.error is not None]
+        if errors:
+            raise RuntimeError(f"не создано пользователей: {len(errors)} из {len(users)}, "
+                               f"первая ошибка: {errors[0].error!r}") from errors[0].error
+
+        # сначала журнал, затем БД - наличие файла БД означает готовый шаблон
+        template.parent.mkdir(parents=True, exist_ok=True)
+        work_wal = self.work_db.with_name(self.work_db.name + "-wal")
+        if work_wal.exists():
+            clone_file(work_wal, template.with_name(template.name + "-wal"))
+        tmp = template.with_name(template.name + ".tmp")
+        clone_file(self.work_db, tmp)
+        os.replace(tmp, template)
+
+    async def prepare_template(self, concurrency: int = 32) -> Optional[Path]:
+        """
+        Подготовить БД-шаблон с пользователями data.generated_users() (один раз, кэш по хэшу описания
+        в <workDir>/.templates) и развернуть его в рабочую дирректорию. Вызывать после path_config, до start
+        """
+        users = self.config.data.generated_users()
+        if not users:
+            return None
+        if self.is_stand_in:  # пользователи добавляются при каждом сбросе заменителя
+            self._seed_users = users
+            return None
+
+        template = Path.cwd().joinpath(self.config.work_dir, ".templates", f"{self._template_key(users)}.db")
+        if not template.exists():
+            logging.info(f"подготовка БД-шаблона {template.name}: {len(users)} пользователей")
+            await self._seed_template(template, users, concurrency)
+        self.template_db = template
+        self._restore_db()
+        return template
+
+    def _get_db_state(self) -> Tuple:
+        """ Снимок (размер, время изменения) файла БД и его журналов - для определения изменений """
+        state = []
+        for suffix in ("", "-wal", "-journal"):
+            path = self.work_db.with_name(self.work_db.name + suffix)
+            if path.exists():
+                stat = path.stat()
+                state.append((suffix, stat.st_size, stat.st_mtime_ns))
+        return tuple(state)
+
+    def path_config(self):
+        if self.is_stand_in and not self.config.service.config.exists():
+            app_cfg = StandInAuthService.default_app_config()
+        else:
+            app_cfg = read_json_config(str(self.config.service.config))
+        app_cfg['log']['dir'] = 'log'
+        log_systems = app_cfg["log"]["systems"]
+        for key in log_systems.keys():
+            log_systems[key] = {"file": True, "level": "trace"}
+
+        # Нужно перепатчить конфиг на дб воркдира
+        app_cfg["core"]["db_path"] = str(self.work_db)
+        app_cfg["rpc"]["port"] = str(self.config.service.port)
+        write_json_config(
+            str(self.work_app_config),
+            app_cfg
+        )
+
+    def deploy(self):
+        """ Функция, которая будет разворачивать рабочее окружение """
+
+        if self.is_stand_in:  # исполняемый файл и БД не нужны
+            os.makedirs(str(self.config.work_dir), exist_ok=True)
+            return
+
+        try:
+            self._copy_artifacts(str(self.config.work_dir))
+        except Exception as e:
+            raise e
+
+    async def start(self):
+        """ Запустить процесс """
+        if self.is_stand_in:
+            self.stand_in = StandInAuthService(read_json_config(str(self.work_app_config)),
+                                               self.config.data.default_user.name,
+                                               self.config.data.default_user.password,
+                                               self._seed_users)
+            Connection.STAND_IN = self.stand_in
+            return
+
+        current_path = Path.cwd()
+        current_dir = current_path.joinpath(self.config.work_dir)  # сформировать с кур дир через патч
+        path_to_w_log = Path(current_dir, "log")
+        self.proc = await asyncio.create_subprocess_exec(
+            self.config.service.execute,
+            self.config.service.param_key, self.config.service.config.name,
+            cwd=str(current_dir),  # work dir з конфига
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        sinks = [
+            (LogSink(str(path_to_w_log.joinpath(name)), max_bytes=self.config.service.log_max_bytes), stream)
+            for name, stream in (("log_stdout.txt", self.proc.stdout), ("log_stderr.txt", self.proc.stderr))
+        ]
+        tasks = [asyncio.create_task(sink.consume(stream)) for sink, stream in sinks]
+
+        self.tasks_read_task = asyncio.gather(
+            *tasks,
+        )
+
+        if self.config.service.sample_interval:
+            self.sampler = ProcSampler(self.proc.pid, self.config.service.sample_interval)
+            self.sampler.start()
+
+    async def _stop_sampler(self):
+        """ Остановить опрос /proc, снимки остаются в sampler.samples """
+        if self.sampler is not None:
+            await self.sampler.stop()
+
+    async def _probe(self) -> bool:
+        """
+        Пробное соединение с рукопожатием JSON-RPC, True - сервис принимает соединения.
+        Соединение закрывается и при ошибке, и при отмене (таймаут wait_ready)
+        """
+        probe = Connection(session=self.probe_session)
+        try:
+            return await probe.start(self.config.service.port) is not False
+        except Exception:  # порт еще не слушается
+            return False
+        finally:
+            try:
+                await probe.stop()
+            except Exception:
+                pass
+
+    async def wait_ready(self) -> float:
+        """
+        Дождаться готовности сервиса: опрос порта рукопожатием с экспоненциальной задержкой до ready_timeout.
+        Запоминает состояние БД и время до готовности (ready_times), вернет время до готовности в секундах
+        """
+        if self.is_stand_in:
+            self.ready_times.append(0)
+            return 0
+
+        begin = time.monotonic()
+        deadline = begin + self.ready_timeout
+        delay = self.ready_first_delay
+        while True:
+            if self.proc.returncode is not None:
+                raise RuntimeError(f"auth_service завершился при запуске, код {self.proc.returncode}")
+            try:
+                # порт может принять соединение, но не ответить на рукопожатие - попытка не дольше срока
+                if await asyncio.wait_for(self._probe(), max(deadline - time.monotonic(), 0)):
+                    break
+            except asyncio.TimeoutError:  # еще не готов
+                pass
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(f"auth_service не принял соединение за {self.ready_timeout} сек")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.ready_max_delay)
+
+        time_to_ready = time.monotonic() - begin
+        self.ready_times.append(time_to_ready)
+        logging.info(f"auth_service готов через {time_to_ready:.3f} сек")
+        self._db_state = self._get_db_state()
+        return time_to_ready
+
+    async def _terminate(self):
+        """ Завершить процесс, при зависании - убить """
+        if self.is_stand_in:
+            Connection.STAND_IN = None
+            return
+        await self._stop_sampler()
+        if self.proc is None:  # процесс не был запущен
+            return
+        if self.proc.returncode is None:
+            self.proc.terminate()
+            try:
+                await asyncio.wait_for(self.proc.wait(), timeout=self.timer)
+            except asyncio.TimeoutError:
+                self.proc.kill()
+                await self.proc.wait()
+        if self.tasks_read_task is not None:
+            await self.tasks_read_task
+
+    async def stop(self):
+        if self.is_stand_in:
+            Connection.STAND_IN = None
+            return
+        await asyncio.sleep(self.timer)
+        await self._stop_sampler()
+        if self.proc.returncode is not None:
+            return
+        else:
+            self.proc.terminate()
+            try:
+                await asyncio.wait_for(self.proc.wait(), timeout=self.timer)
+            except asyncio.TimeoutError:
+                self.proc.kill()
+
+    def is_dirty(self) -> bool:
+        """ Изменилась ли БД (или упал процесс) с момента запуска """
+        if self.is_stand_in:
+            return self.stand_in.changed
+        return self.proc.returncode is not None or self._get_db_state() != self._db_state
+
+    async def reset(self) -> bool:
+        """
+        Вернуть сервис в исходное состояние между тестами.
+        Перезапуск с подменой БД выполняется только если БД изменилась, иначе процесс продолжает работать.
+        Вернет True если был перезапуск
+        """
+        if not self.is_dirty():
+            return False
+        if self.is_stand_in:
+            self.stand_in.reset()
+            return True
+        await self._terminate()
+        self._restore_db()
+        await self.start()
+        await self.wait_ready()
+        return True
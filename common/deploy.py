@@ -0,0 +1,108 @@
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from typing import Dict
+
+try:
+    import fcntl  # reflink через ioctl FICLONE (Linux: btrfs, xfs)
+except ImportError:
+    fcntl = None
+
+__all__ = [
+    "DeployCache",
+    "clone_file",
+    "file_hash",
+]
+
+FICLONE = 0x40049409
+_CHUNK = 1024 * 1024
+
+
+def file_hash(path: Path) -> str:
+    """ sha256 содержимого файла """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except OSError:  # файловая система не поддерживает reflink
+        if dst.exists():
+            dst.unlink()
+        return False
+    return True
+
+
+def clone_file(src: Path, dst: Path) -> str:
+    """
+    Получить независимую копию src в dst: reflink (копирование при записи, время не зависит от размера),
+    если файловая система не умеет - обычное копирование. Вернет способ: "reflink" или "copy"
+    """
+    if dst.exists():
+        dst.unlink()
+    if _reflink(src, dst):
+        shutil.copystat(src, dst)
+        return "reflink"
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+class DeployCache:
+    MANIFEST = ".deploy_cache.json"
+
+    def __init__(self, work_dir: Path):
+        """
+        Кэш развертывания артефактов в рабочую дирректорию
+
+        в манифесте <work_dir>/.deploy_cache.json хранится хэш содержимого каждого артефакта и размер / время
+        его развернутой копии, неизменившиеся файлы не копируются (хэш исходника пересчитывается, только если
+        поменялись размер или время). Копия, измененная в work_dir (другие размер или время), копируется заново
+        """
+        self.work_dir = Path(work_dir)
+        self.path = self.work_dir.joinpath(self.MANIFEST)
+        self.manifest: Dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="UTF-8") as f:
+                self.manifest = json.load(f)
+
+    def _save(self):
+        with open(self.path, "w", encoding="UTF-8") as f:
+            json.dump(self.manifest, f, indent=4, sort_keys=True)
+
+    def _source_hash(self, src: Path) -> str:
+        stat = src.stat()
+        entry = self.manifest.get(str(src))
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["hash"]
+        return file_hash(src)
+
+    @staticmethod
+    def _changed(dst: Path, entry: dict) -> bool:
+        """ Развернутая копия изменена после sync (манифест без dst_* - считается измененной) """
+        stat = dst.stat()
+        return entry.get("dst_size") != stat.st_size or entry.get("dst_mtime_ns") != stat.st_mtime_ns
+
+    def sync(self, src: Path) -> bool:
+        """ Скопировать src в work_dir, если копия отличается. Вернет True если было копирование """
+        src = Path(src)
+        dst = self.work_dir.joinpath(src.name)
+        source_hash = self._source_hash(src)
+        entry = self.manifest.get(str(src))
+        copied = False
+        if not dst.exists() or entry is None or entry["hash"] != source_hash or self._changed(dst, entry):
+            clone_file(src, dst)
+            copied = True
+        stat = src.stat()
+        deployed = dst.stat()
+        self.manifest[str(src)] = {"hash": source_hash, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                   "dst_size": deployed.st_size, "dst_mtime_ns": deployed.st_mtime_ns}
+        self._save()
+        return copied
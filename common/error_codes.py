@@ -2,6 +2,7 @@ from enum import Enum
 
 __all__ = [
     "ErrorCodes",
+    "error_name",
 ]
 
 
@@ -12,3 +13,11 @@ class ErrorCodes(Enum):
     BAD_STATE = 4
     OVERFLOW = 5
     ITEM_NOT_FOUND = 6
+
+
+def error_name(code: int) -> str:
+    """ Имя кода ошибки JSON-RPC (ErrorCodes), для неизвестных - сам код """
+    try:
+        return ErrorCodes(code).name
+    except ValueError:
+        return str(code)
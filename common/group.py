@@ -1,4 +1,6 @@
-from typing import List, Optional
+import asyncio
+import time
+from typing import List, Optional, Dict
 
 __all__ = ["Group"]
 
@@ -12,11 +14,25 @@ class Group:
         self.port = port
         self.connection: List[Connection] = []
         self.token: str = ""
+        self.timings: Dict[str, float] = {}  # время шагов create: connect, login, restore (сек)
 
-    async def create(self, count_connects: int, session: int):
-        """ Сессии не должны повторяться сессия админа - 3000, пользовательские с 3001 """
+    async def create(self, count_connects: int, session: Optional[int] = None, concurrency: Optional[int] = None):
+        """
+        Сессии не должны повторяться сессия админа - 3000, пользовательские с 3001
+        :param session: - первый идентификатор сессии, None - выдаются Connection.SESSION_IDS
+        :param concurrency: - None - соединения создаются последовательно, restore по цепочке токенов,
+        иначе параллельно, не более concurrency одновременных подключений:
+        все соединения открываются сразу, login первым, остальные restore от его токена
+        """
+        if concurrency is None:
+            await self._create_serial(count_connects, session)
+        else:
+            await self._create_concurrent(count_connects, session, concurrency)
+
+    async def _create_serial(self, count_connects: int, session: Optional[int]):
+        begin = time.monotonic()
         for i in range(0, count_connects):
-            connect = Connection(session=session + i)
+            connect = Connection(session=None if session is None else session + i)
             await connect.start(self.port)
             # первое соединение login
             if i == 0:
@@ -25,6 +41,33 @@ class Group:
             else:
                 self.token = await connect.rpc("Auth.Session.restore", self.token)
             self.connection.append(connect)
+        self.timings["total"] = time.monotonic() - begin
+
+    async def _create_concurrent(self, count_connects: int, session: Optional[int], concurrency: int):
+        semaphore = asyncio.Semaphore(concurrency)
+        connects = [Connection(session=None if session is None else session + i) for i in range(0, count_connects)]
+        self.connection.extend(connects)  # при ошибке созданные соединения остаются доступны для закрытия
+
+        async def _start(connect: Connection):
+            async with semaphore:
+                await connect.start(self.port)
+
+        async def _restore(connect: Connection, token: str) -> str:
+            async with semaphore:
+                return await connect.rpc("Auth.Session.restore", token)
+
+        begin = time.monotonic()
+        await asyncio.gather(*[_start(connect) for connect in connects])
+        self.timings["connect"] = time.monotonic() - begin
+
+        step = time.monotonic()
+        self.token = await connects[0].login(self.user.name, self.user.password)
+        self.timings["login"] = time.monotonic() - step
+
+        step = time.monotonic()
+        await asyncio.gather(*[_restore(connect, self.token) for connect in connects[1:]])
+        self.timings["restore"] = time.monotonic() - step
+        self.timings["total"] = time.monotonic() - begin
 
     def set_id(self, id: int):
         self.id = id
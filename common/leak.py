@@ -0,0 +1,134 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from common import Config, Connection, Group, User, ConnectionsSnapshot, read_proc
+from common.load import _user
+
+__all__ = [
+    "LEAK_SCENARIOS",
+    "LeakDetector",
+    "fit_slope",
+    "format_leak_report",
+]
+
+
+async def _drop_by_group(admin: Connection, user: User, port: int, size: int):
+    """ Group.create(size) -> Auth.Connections.dropByGroup (как test_drop_by_group) -> закрыть соединения """
+    group = Group(user, port)
+    await group.create(size, concurrency=size)
+    try:
+        group.set_id((await ConnectionsSnapshot.fetch(group.connection[0])).this.group_id)
+        dropped = await admin.rpc("Auth.Connections.dropByGroup", group.id)
+        if dropped != size:
+            raise RuntimeError(f"Auth.Connections.dropByGroup разорвал {dropped} соединений из {size}")
+    finally:
+        await asyncio.gather(*[connect.stop() for connect in group.connection])
+
+
+async def _login_logout(admin: Connection, user: User, port: int, size: int):
+    """ size соединений: start -> login -> Auth.Session.logout -> stop """
+    async def _cycle():
+        connect = Connection()
+        await connect.start(port)
+        try:
+            await connect.login(user.name, user.password)
+            if await connect.rpc("Auth.Session.logout") is not True:
+                raise RuntimeError("Auth.Session.logout не вернул true")
+        finally:
+            await connect.stop()
+
+    await asyncio.gather(*[_cycle() for _ in range(size)])
+
+
+# сценарий: (админское соединение, пользователь, порт, размер) -> одна итерация
+LEAK_SCENARIOS: Dict[str, Callable[[Connection, User, int, int], Awaitable]] = {
+    "drop_group": _drop_by_group,
+    "login_logout": _login_logout,
+}
+
+
+def fit_slope(xs: List[float], ys: List[float]) -> float:
+    """ Наклон прямой по методу наименьших квадратов """
+    n = len(xs)
+    if n < 2:
+        return 0.0
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if variance == 0:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+class LeakDetector:
+    def __init__(self, config: Config, pid: int, scenario: str, iterations: int, warmup: int = 10, size: int = 5,
+                 user_name: Optional[str] = None, max_rss_kb: float = 4, max_fds: float = 0.05,
+                 settle: float = 0.05):
+        """
+        Поиск утечек: сценарий scenario (LEAK_SCENARIOS) повторяется iterations раз на одном сервисе,
+        после каждой итерации (и паузы settle сек) снимаются RSS и число дескрипторов процесса pid.
+        Итерации warmup не учитываются. По снимкам методом наименьших квадратов считается прирост
+        на итерацию, больше max_rss_kb кБ или max_fds дескрипторов - утечка (passed == False)
+        """
+        if scenario not in LEAK_SCENARIOS:
+            raise ValueError(f"неизвестный сценарий {scenario}, доступны: {', '.join(LEAK_SCENARIOS)}")
+        if iterations < 2:
+            raise ValueError(f"для оценки прироста нужно не меньше 2 итераций, задано {iterations}")
+        self.config = config
+        self.pid = pid
+        self.scenario = scenario
+        self.iterations = iterations
+        self.warmup = warmup
+        self.size = size
+        self.user = _user(config, user_name or config.data.users[0].name)  # нет такого - ValueError
+        self.max_rss_kb = max_rss_kb
+        self.max_fds = max_fds
+        self.settle = settle
+        self.rss_kb: List[int] = []
+        self.fds: List[int] = []
+
+    async def _iteration(self, admin: Connection):
+        await LEAK_SCENARIOS[self.scenario](admin, self.user, self.config.service.port, self.size)
+        await asyncio.sleep(self.settle)
+
+    async def run(self) -> dict:
+        admin = Connection(kind="admin")
+        await admin.start(self.config.service.port)
+        await admin.login(self.config.data.default_user.name, self.config.data.default_user.password)
+        try:
+            for _ in range(self.warmup):
+                await self._iteration(admin)
+            for _ in range(self.iterations):
+                await self._iteration(admin)
+                sample = read_proc(self.pid)
+                if sample is None:
+                    raise RuntimeError(f"процесс {self.pid} завершился")
+                self.rss_kb.append(sample.rss_kb)
+                self.fds.append(sample.fds or 0)
+        finally:
+            await admin.stop()
+        return self.report()
+
+    def report(self) -> dict:
+        xs = list(range(len(self.rss_kb)))
+        rss_slope = fit_slope(xs, self.rss_kb)
+        fds_slope = fit_slope(xs, self.fds)
+        return {
+            "scenario": self.scenario,
+            "iterations": len(xs),
+            "size": self.size,
+            "rss_kb": {"first": self.rss_kb[0], "last": self.rss_kb[-1], "per_iteration": rss_slope,
+                       "limit": self.max_rss_kb},
+            "fds": {"first": self.fds[0], "last": self.fds[-1], "per_iteration": fds_slope, "limit": self.max_fds},
+            "passed": rss_slope <= self.max_rss_kb and fds_slope <= self.max_fds,
+        }
+
+
+def format_leak_report(report: dict) -> str:
+    lines = [f"{report['scenario']}: {report['iterations']} итераций по {report['size']} соединений",
+             f"{'metric':<8}{'first':>12}{'last':>12}{'per iter':>12}{'limit':>10}"]
+    for name in ("rss_kb", "fds"):
+        row = report[name]
+        lines.append(f"{name:<8}{row['first']:>12}{row['last']:>12}{row['per_iteration']:>12.3f}{row['limit']:>10}")
+    lines.append("OK" if report["passed"] else "УТЕЧКА: прирост на итерацию выше порога")
+    return "\n".join(lines)
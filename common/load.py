@@ -0,0 +1,558 @@
+import asyncio
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, List
+
+from bolid_jsonrpc import JsonRpcMethodCallError
+
+from common import Config, Connection, LatencyHistogram, error_name, Group, NotificationStream, ConnectionsSnapshot, \
+    Controller
+
+__all__ = [
+    "LOAD_METHODS",
+    "OPEN_LOOP_METHODS",
+    "LoadGenerator",
+    "OpenLoopGenerator",
+    "format_open_loop_report",
+    "ShardedLoad",
+    "FanoutBenchmark",
+    "format_fanout_report",
+    "parse_mix",
+    "format_report",
+    "provision_user",
+]
+
+# операции нагрузки: короткое имя -> метод в отчете
+LOAD_METHODS: Dict[str, str] = {
+    "login": "auth_login",
+    "restore": "Auth.Session.restore",
+    "whoami": "Auth.User.whoami",
+    "logout": "Auth.Session.logout",
+}
+
+# операции открытой нагрузки (OpenLoopGenerator)
+OPEN_LOOP_METHODS: Dict[str, str] = {
+    "login": "auth_login",
+    "restore": "Auth.Session.restore",
+    "list": "Auth.Connections.list",
+}
+
+
+def parse_mix(mix: str, methods: Dict[str, str] = None) -> Dict[str, float]:
+    """ "login=1,whoami=8" -> {"login": 1.0, "whoami": 8.0}, methods - допустимые операции (LOAD_METHODS) """
+    methods = LOAD_METHODS if methods is None else methods
+    weights = {}
+    for item in mix.split(","):
+        name, weight = item.split("=")
+        name = name.strip()
+        if name not in methods:
+            raise ValueError(f"неизвестная операция {name}, доступны: {', '.join(methods)}")
+        weights[name] = float(weight)
+    return weights
+
+
+def _user(config: Config, user_name: str):
+    """ Пользователь user_name из data.users, нет такого - ValueError """
+    for user in config.data.users:
+        if user.name == user_name:
+            return user
+    raise ValueError(f"пользователь {user_name} не найден в data.users")
+
+
+async def provision_user(config: Config, user_name: str):
+    """
+    Создать пользователя из data.users под админом и назначить ему роль.
+    Если пользователь уже есть (Auth.User.add вернет false) - только роль
+    """
+    if user_name == config.data.default_user.name:
+        return
+    user = _user(config, user_name)
+    admin = Connection(kind="admin")
+    await admin.start(config.service.port)
+    try:
+        await admin.login(config.data.default_user.name, config.data.default_user.password)
+        await admin.rpc("Auth.User.add", user.name, user.password)  # false - пользователь уже существует
+        await admin.rpc("Auth.User.Role.set", user.name, user.role)
+    finally:
+        await admin.stop()
+
+
+class LoadGenerator:
+    def __init__(self, config: Config, mix: Dict[str, float], concurrency: int, duration: float,
+                 user_name: Optional[str] = None):
+        """
+        Замкнутая нагрузка: concurrency соединений, каждое выполняет операции из mix (веса)
+        одну за другой в течение duration сек
+
+        login/restore/whoami/logout выполняются от имени user_name (по умолчанию data.defaultUser),
+        операции, недоступные в текущем состоянии соединения (whoami без авторизации, restore без токена),
+        заменяются на login
+        """
+        self.config = config
+        self.ops: List[str] = list(mix)
+        self.weights: List[float] = [mix[op] for op in self.ops]
+        self.concurrency = concurrency
+        self.duration = duration
+        self.user_name = user_name or config.data.default_user.name
+        self.histograms: Dict[str, LatencyHistogram] = {method: LatencyHistogram() for method in LOAD_METHODS.values()}
+        self.errors: Dict[str, Dict[str, int]] = {method: {} for method in LOAD_METHODS.values()}
+        self.elapsed: float = 0
+
+    def _password(self) -> str:
+        if self.user_name == self.config.data.default_user.name:
+            return self.config.data.default_user.password
+        return _user(self.config, self.user_name).password
+
+    def _add_error(self, method: str, error: str):
+        self.errors[method][error] = self.errors[method].get(error, 0) + 1
+
+    async def _worker(self, deadline: float):
+        password = self._password()
+        connect = Connection()
+        await connect.start(self.config.service.port)
+        authenticated = False
+        try:
+            while time.monotonic() < deadline:
+                op = random.choices(self.ops, self.weights)[0]
+                if not authenticated and op != "restore":
+                    op = "login"
+                if op == "restore" and not connect.token:
+                    op = "login"
+                method = LOAD_METHODS[op]
+
+                begin = time.perf_counter()
+                try:
+                    if op == "login":
+                        await connect.login(self.user_name, password)
+                        authenticated = True
+                    elif op == "restore":
+                        connect.token = await connect.rpc(method, connect.token)
+                        authenticated = True
+                    else:
+                        await connect.rpc(method)
+                    if op == "logout":  # сессия завершена, ее токен больше не действует
+                        authenticated = False
+                        connect.token = None
+                except JsonRpcMethodCallError as ex:
+                    self._add_error(method, error_name(ex.code))
+                    authenticated = False
+                    connect.token = None
+                except Exception as ex:  # соединение потеряно - воркер завершается
+                    self._add_error(method, type(ex).__name__)
+                    break
+                finally:
+                    self.histograms[method].record(time.perf_counter() - begin)
+        finally:
+            await connect.stop()
+
+    async def run(self) -> dict:
+        """ Выполнить нагрузку, вернуть отчет """
+        begin = time.monotonic()
+        deadline = begin + self.duration
+        await asyncio.gather(*[self._worker(deadline) for _ in range(self.concurrency)])
+        self.elapsed = time.monotonic() - begin
+        return self.report()
+
+    def report(self) -> dict:
+        elapsed = max(self.elapsed, 1e-9)  # report() до run() или нулевая длительность
+        methods = {}
+        for method, histogram in self.histograms.items():
+            if histogram.count == 0:
+                continue
+            methods[method] = dict(histogram.summary(),
+                                   rps=histogram.count / elapsed,
+                                   errors=self.errors[method])
+        return {
+            "concurrency": self.concurrency,
+            "elapsed": self.elapsed,
+            "rps": sum(histogram.count for histogram in self.histograms.values()) / elapsed,
+            "methods": methods,
+        }
+
+
+def format_report(report: dict) -> str:
+    """ Отчет нагрузки в виде таблицы """
+    lines = [
+        f"{'method':<24}{'count':>9}{'rps':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}  errors",
+    ]
+    for method, row in report["methods"].items():
+        errors = ", ".join(f"{name}={count}" for name, count in row["errors"].items())
+        lines.append(f"{method:<24}{row['count']:>9}{row['rps']:>10.1f}{row['p50_ms']:>10.2f}"
+                     f"{row['p90_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['max_ms']:>10.2f}  {errors}")
+    lines.append(f"total: {report['rps']:.1f} rps, {report['elapsed']:.1f} s")
+    return "\n".join(lines)
+
+
+class OpenLoopGenerator:
+    def __init__(self, config: Config, mix: Dict[str, float], rate: float, duration: float, connections: int = 16,
+                 user_name: Optional[str] = None, max_outstanding: int = 10000, drain_timeout: float = 10):
+        """
+        Открытая нагрузка: запросы из mix (login/restore/list) отправляются с постоянной частотой rate в секунду
+        по расписанию, независимо от того, пришли ли ответы на предыдущие (конвейер по connections соединениям)
+
+        Задержка считается от запланированного времени отправки (коррекция coordinated omission):
+        если клиент или сервис отстали, ожидание в очереди попадает в задержку. Для сравнения отдельно
+        пишется время от фактической отправки (service). Больше max_outstanding запросов в полете -
+        запрос не отправляется (ошибка client_overload), не завершившиеся за drain_timeout после конца - unfinished
+        """
+        self.config = config
+        self.ops: List[str] = list(mix)
+        self.weights: List[float] = [mix[op] for op in self.ops]
+        self.rate = rate
+        self.duration = duration
+        self.connections = connections
+        self.user_name = user_name or config.data.default_user.name
+        self.max_outstanding = max_outstanding
+        self.drain_timeout = drain_timeout
+        self.histograms: Dict[str, LatencyHistogram] = {method: LatencyHistogram()
+                                                        for method in OPEN_LOOP_METHODS.values()}
+        self.service: Dict[str, LatencyHistogram] = {method: LatencyHistogram()
+                                                     for method in OPEN_LOOP_METHODS.values()}
+        self.errors: Dict[str, Dict[str, int]] = {method: {} for method in OPEN_LOOP_METHODS.values()}
+        self.sent = 0
+        self.elapsed: float = 0
+        self._outstanding = 0
+
+    def _password(self) -> str:
+        if self.user_name == self.config.data.default_user.name:
+            return self.config.data.default_user.password
+        return _user(self.config, self.user_name).password
+
+    def _add_error(self, method: str, error: str):
+        self.errors[method][error] = self.errors[method].get(error, 0) + 1
+
+    async def _open(self) -> List[Connection]:
+        connects = [Connection() for _ in range(self.connections)]
+        for connect in connects:
+            await connect.start(self.config.service.port)
+            await connect.login(self.user_name, self._password())
+        return connects
+
+    async def _send(self, connect: Connection, op: str, intended: float):
+        method = OPEN_LOOP_METHODS[op]
+        sent = time.perf_counter()
+        try:
+            try:
+                if op == "login":
+                    await connect.login(self.user_name, self._password())
+                elif op == "restore":
+                    await connect.rpc(method, connect.token)
+                else:
+                    await connect.rpc(method)
+            except asyncio.CancelledError:  # не дождались за drain_timeout - учтен в unfinished, без задержки
+                raise
+            except JsonRpcMethodCallError as ex:
+                self._add_error(method, error_name(ex.code))
+            except Exception as ex:
+                self._add_error(method, type(ex).__name__)
+            # задержка - только у завершившихся запросов (ответ или ошибка)
+            done = time.perf_counter()
+            self.histograms[method].record(done - intended)
+            self.service[method].record(done - sent)
+        finally:
+            self._outstanding -= 1
+
+    async def run(self) -> dict:
+        """ Выполнить нагрузку, вернуть отчет """
+        connects = await self._open()
+        tasks = set()
+        begin = time.perf_counter()
+        total = int(self.rate * self.duration)
+        try:
+            for i in range(total):
+                intended = begin + i / self.rate
+                delay = intended - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                op = random.choices(self.ops, self.weights)[0]
+                if self._outstanding >= self.max_outstanding:
+                    self._add_error(OPEN_LOOP_METHODS[op], "client_overload")
+                    continue
+                self._outstanding += 1
+                self.sent += 1
+                task = asyncio.ensure_future(self._send(connects[i % len(connects)], op, intended))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                _, pending = await asyncio.wait(set(tasks), timeout=self.drain_timeout)
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    await asyncio.wait(pending, timeout=1)
+                    self.errors["unfinished"] = {"unfinished": len(pending)}
+            self.elapsed = time.perf_counter() - begin
+        finally:
+            await asyncio.gather(*[connect.stop() for connect in connects], return_exceptions=True)
+        return self.report()
+
+    def report(self) -> dict:
+        methods = {}
+        for method, histogram in self.histograms.items():
+            if histogram.count == 0:
+                continue
+            methods[method] = dict(histogram.summary(),
+                                   rps=histogram.count / self.elapsed,
+                                   rejected=self.errors[method].get("client_overload", 0),
+                                   service=self.service[method].summary(),
+                                   errors=self.errors[method])
+        completed = sum(histogram.count for histogram in self.histograms.values())
+        overall = LatencyHistogram()
+        for histogram in self.histograms.values():
+            overall.merge(histogram)
+        return {
+            "rate": self.rate,
+            "sent": self.sent,
+            "elapsed": self.elapsed,
+            "rps": completed / self.elapsed,
+            "errors": sum(sum(errors.values()) for errors in self.errors.values()),
+            # не отправлены (client_overload): в задержках их нет, колено по ним тоже ищется
+            "rejected": sum(errors.get("client_overload", 0) for errors in self.errors.values()),
+            "latency": overall.summary(),
+            "methods": methods,
+        }
+
+    @classmethod
+    async def sweep(cls, config: Config, mix: Dict[str, float], rates: List[float], duration: float,
+                    connections: int = 16, user_name: Optional[str] = None, knee_p99_factor: float = 5,
+                    processes: int = 1) -> dict:
+        """
+        Прогоны на каждой частоте rates. Колено - последняя частота, на которой достигнуто 95% заданной
+        пропускной способности, нет ошибок (в том числе отказов client_overload)
+        и p99 не больше knee_p99_factor * p99 первой (самой низкой) частоты
+        processes > 1 - каждый прогон делится между процессами (ShardedLoad)
+        """
+        runs = []
+        knee = None
+        for rate in sorted(rates):
+            params = dict(mix=mix, rate=rate, duration=duration, connections=connections, user_name=user_name)
+            if processes > 1:
+                report = await ShardedLoad(config, processes).run("open", params)
+            else:
+                report = await cls(config, **params).run()
+            runs.append(report)
+            baseline = runs[0]["latency"]["p99_ms"]
+            if report["rps"] < 0.95 * rate or report["errors"] or report["rejected"] \
+                    or report["latency"]["p99_ms"] > knee_p99_factor * baseline:
+                break
+            knee = rate
+        return {"runs": runs, "knee": knee}
+
+
+def format_open_loop_report(report: dict) -> str:
+    """ Отчет OpenLoopGenerator.sweep: задержка от запланированного времени отправки по частотам """
+    lines = [
+        f"{'rate':>9}{'rps':>10}{'errors':>8}{'rejected':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"
+        f"{'max ms':>10}{'svc p99 ms':>12}",
+    ]
+    for run in report["runs"]:
+        latency = run["latency"]
+        service = max((row["service"]["p99_ms"] for row in run["methods"].values()), default=0)
+        lines.append(f"{run['rate']:>9.0f}{run['rps']:>10.1f}{run['errors']:>8}{run['rejected']:>10}"
+                     f"{latency['p50_ms']:>10.2f}{latency['p90_ms']:>10.2f}{latency['p99_ms']:>10.2f}"
+                     f"{latency['max_ms']:>10.2f}{service:>12.2f}")
+    lines.append(f"knee: {report['knee']} rps" if report["knee"] is not None else "knee: не найдено")
+    return "\n".join(lines)
+
+
+# генераторы, которые можно делить между процессами, и их параметры, делящиеся на доли
+_SHARDED_GENERATORS = {
+    "closed": (LoadGenerator, ("concurrency",)),
+    "open": (OpenLoopGenerator, ("rate", "connections")),
+}
+_HISTOGRAM_ATTRIBUTES = ("histograms", "service")
+
+
+def _share(value, index: int, count: int):
+    """ Доля index из count: целые - поровну с остатком первым (count не больше value), дробные - поровну """
+    if isinstance(value, int):
+        return value // count + (1 if index < value % count else 0)
+    return value / count
+
+
+def _dump_state(generator) -> dict:
+    """ Состояние генератора после run для передачи из процесса воркера """
+    state = {"errors": generator.errors, "elapsed": generator.elapsed, "sent": getattr(generator, "sent", 0)}
+    for name in _HISTOGRAM_ATTRIBUTES:
+        if hasattr(generator, name):
+            state[name] = {method: histogram.to_dict() for method, histogram in getattr(generator, name).items()}
+    return state
+
+
+def _merge_state(generator, state: dict):
+    for name in _HISTOGRAM_ATTRIBUTES:
+        for method, data in state.get(name, {}).items():
+            getattr(generator, name)[method].merge(LatencyHistogram.from_dict(data))
+    for method, errors in state["errors"].items():
+        merged = generator.errors.setdefault(method, {})
+        for error, count in errors.items():
+            merged[error] = merged.get(error, 0) + count
+    generator.elapsed = max(generator.elapsed, state["elapsed"])
+    if hasattr(generator, "sent"):
+        generator.sent += state["sent"]
+
+
+async def _run_shard(config: Config, index: int, count: int, kind: str, params: dict) -> dict:
+    Connection.SESSION_IDS.partition(index, count)
+    if config.service.mode == "stand_in":  # у воркера свой сервис в процессе - проверка самого генератора
+        await Controller(config).start()
+        await provision_user(config, params.get("user_name") or config.data.default_user.name)
+    generator = _SHARDED_GENERATORS[kind][0](config, **params)
+    await generator.run()
+    return _dump_state(generator)
+
+
+def _shard_main(config: Config, index: int, count: int, kind: str, params: dict) -> dict:
+    """ Точка входа процесса воркера: свой цикл событий, свои соединения и поддиапазон client_id """
+    return asyncio.run(_run_shard(config, index, count, kind, params))
+
+
+class ShardedLoad:
+    def __init__(self, config: Config, processes: int):
+        """
+        Нагрузка из нескольких процессов: один клиентский цикл asyncio не успевает открыть столько соединений
+        и разобрать столько ответов, сколько выдерживает сервис
+
+        каждый процесс выполняет свою долю нагрузки (concurrency, rate, connections делятся поровну)
+        со своим циклом событий, соединениями и поддиапазоном идентификаторов (SessionIdAllocator.partition),
+        гистограммы и ошибки процессов объединяются в один отчет.
+        Процессов не больше, чем соединений (concurrency, connections): иначе доля процесса была бы пустой
+        """
+        self.config = config
+        self.processes = processes
+
+    async def run(self, kind: str, params: dict) -> dict:
+        """ kind - closed (LoadGenerator) или open (OpenLoopGenerator), params - параметры генератора """
+        generator_class, shared = _SHARDED_GENERATORS[kind]
+        processes = min([self.processes] + [params[name] for name in shared if isinstance(params[name], int)])
+        if processes < 1:
+            raise ValueError(f"{', '.join(shared)} должны быть больше 0")
+        shards = [dict(params, **{name: _share(params[name], index, processes) for name in shared})
+                  for index in range(processes)]
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+            states = await asyncio.gather(*[
+                loop.run_in_executor(pool, _shard_main, self.config, index, processes, kind, shards[index])
+                for index in range(processes)
+            ])
+        generator = generator_class(self.config, **params)
+        for state in states:
+            _merge_state(generator, state)
+        report = generator.report()
+        report["processes"] = processes
+        return report
+
+
+class FanoutBenchmark:
+    DROP_METHODS = {"group": "Auth.Connections.dropByGroup", "user": "Auth.Connections.dropByUser"}
+
+    def __init__(self, config: Config, watchers: List[int], sizes: List[int], modes: List[str],
+                 repeat: int = 3, user_name: Optional[str] = None, timeout: float = 30):
+        """
+        Задержка рассылки Auth.Connections.Event.Down в зависимости от числа подписчиков и размера группы
+
+        Для каждого числа watchers: столько админских соединений с Auth.Connections.watch(true),
+        для каждого размера группы sizes и способа сброса modes (group - dropByGroup, user - dropByUser)
+        repeat раз: Group из size соединений пользователя user_name, сброс отдельным админским соединением,
+        время от вызова сброса до последнего Event.Down у каждого подписчика.
+        Пользователь user_name (по умолчанию первый из data.users) должен существовать и не иметь других соединений
+        """
+        for mode in modes:
+            if mode not in self.DROP_METHODS:
+                raise ValueError(f"неизвестный способ сброса {mode}, доступны: {', '.join(self.DROP_METHODS)}")
+        self.config = config
+        self.watchers = watchers
+        self.sizes = sizes
+        self.modes = modes
+        self.repeat = repeat
+        self.user = _user(config, user_name or config.data.users[0].name)
+        self.timeout = timeout
+        self.rows: List[dict] = []
+
+    async def _admin(self) -> Connection:
+        connect = Connection(kind="admin")
+        await connect.start(self.config.service.port)
+        await connect.login(self.config.data.default_user.name, self.config.data.default_user.password)
+        return connect
+
+    @staticmethod
+    async def _wait_down(stream: NotificationStream, uids: int, begin: float) -> float:
+        """ Дождаться Event.Down для uids соединений, вернет время последнего от begin """
+        received = 0
+        async for notification in stream:
+            received += len(notification.data)
+            if received >= uids:
+                return notification.received - begin
+
+    async def _drop_once(self, dropper: Connection, streams: List[NotificationStream], size: int,
+                         mode: str) -> List[float]:
+        group = Group(self.user, self.config.service.port)
+        await group.create(size, concurrency=32)
+        try:
+            target = self.user.name
+            if mode == "group":
+                target = (await ConnectionsSnapshot.fetch(group.connection[0])).this.group_id
+            for stream in streams:
+                stream.clear()
+                stream.mark()
+            begin = time.perf_counter()
+            dropped = await dropper.rpc(self.DROP_METHODS[mode], target)
+            if dropped != size:
+                raise RuntimeError(f"{self.DROP_METHODS[mode]} разорвал {dropped} соединений из {size}")
+            return await asyncio.wait_for(
+                asyncio.gather(*[self._wait_down(stream, size, begin) for stream in streams]),
+                self.timeout)
+        finally:
+            await asyncio.gather(*[connect.stop() for connect in group.connection])
+
+    async def _run_watchers(self, count: int):
+        watchers = [await self._admin() for _ in range(count)]
+        dropper = await self._admin()
+        try:
+            streams = []
+            for watcher in watchers:
+                streams.append(NotificationStream().attach(watcher.rpc, {"Auth.Connections.Event.Down": List[int]}))
+                await watcher.rpc("Auth.Connections.watch", True)
+            for mode in self.modes:
+                for size in self.sizes:
+                    last = LatencyHistogram()  # до последнего Event.Down у всех подписчиков
+                    per_watcher = LatencyHistogram()  # до последнего Event.Down у каждого подписчика
+                    for _ in range(self.repeat):
+                        times = await self._drop_once(dropper, streams, size, mode)
+                        last.record(max(times))
+                        for value in times:
+                            per_watcher.record(value)
+                    self.rows.append({
+                        "mode": mode,
+                        "watchers": count,
+                        "size": size,
+                        "drops": self.repeat,
+                        "last": last.summary(),
+                        "per_watcher": per_watcher.summary(),
+                    })
+        finally:
+            await asyncio.gather(*[connect.stop() for connect in watchers + [dropper]])
+
+    async def run(self) -> dict:
+        """ Выполнить все сочетания, вернуть отчет """
+        for count in self.watchers:
+            await self._run_watchers(count)
+        return self.report()
+
+    def report(self) -> dict:
+        return {"fanout": self.rows}
+
+
+def format_fanout_report(report: dict) -> str:
+    """ Отчет FanoutBenchmark: задержка до последнего Event.Down (по всем подписчикам и по каждому) """
+    lines = [
+        f"{'mode':<7}{'watchers':>9}{'size':>7}{'drops':>7}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        f"{'watcher p50':>13}{'watcher p99':>13}",
+    ]
+    for row in report["fanout"]:
+        last, per_watcher = row["last"], row["per_watcher"]
+        lines.append(f"{row['mode']:<7}{row['watchers']:>9}{row['size']:>7}{row['drops']:>7}"
+                     f"{last['p50_ms']:>10.2f}{last['p99_ms']:>10.2f}{last['max_ms']:>10.2f}"
+                     f"{per_watcher['p50_ms']:>13.2f}{per_watcher['p99_ms']:>13.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,94 @@
+import asyncio
+import codecs
+import os
+import time
+from pathlib import Path
+from typing import Optional, IO
+
+__all__ = [
+    "LogSink",
+]
+
+FILE_ENCODING = "UTF-8"  # кодировка файла лога (encoding - кодировка вывода процесса)
+
+
+class LogSink:
+    def __init__(self,
+                 file_name: str,
+                 encoding: str = "CP866",
+                 chunk_size: int = 64 * 1024,
+                 buffer_size: int = 256 * 1024,
+                 flush_interval: float = 1,
+                 max_bytes: Optional[int] = None,
+                 backup_count: int = 5):
+        """
+        Приемник вывода процесса (stdout/stderr) в файл
+
+        файл открыт все время работы, запись буферизована (buffer_size) и сбрасывается на диск
+        не чаще чем раз в flush_interval сек, чтение потока кусками по chunk_size
+        с инкрементальным декодером (encoding), границы строк сохраняются.
+        :param max_bytes: - ротация файла по размеру (file_name -> file_name.1 ... file_name.<backup_count>),
+        None - без ротации
+        """
+        self.path = Path(file_name)
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.written: int = 0  # записано в текущий файл, байт (FILE_ENCODING)
+        self._file: Optional[IO] = None
+        self._last_flush = time.monotonic()
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding=FILE_ENCODING, newline="", buffering=self.buffer_size)
+        self.written = self.path.stat().st_size
+
+    def _rotate(self):
+        """ Сдвинуть файлы file.1 -> file.2 ... и начать новый файл """
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backup_count > 0:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._open()
+
+    def write(self, text: str):
+        """ Записать текст, ротация выполняется по границе строки """
+        size = len(text.encode(FILE_ENCODING))
+        if self.max_bytes and self.written + size > self.max_bytes:
+            line_end = text.rfind("\n")
+            if line_end >= 0:
+                self._file.write(text[:line_end + 1])
+                text = text[line_end + 1:]
+                size = len(text.encode(FILE_ENCODING))
+            self._rotate()
+        self._file.write(text)
+        self.written += size
+
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self._file.flush()
+            self._last_flush = now
+
+    async def consume(self, stream: asyncio.StreamReader):
+        """ Читать поток до EOF и писать в файл """
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        self._open()
+        try:
+            while True:
+                data = await stream.read(self.chunk_size)
+                if not data:
+                    break
+                self.write(decoder.decode(data))
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                self.write(tail)
+        finally:
+            self._file.close()
@@ -0,0 +1,84 @@
+import json
+import time
+from typing import Dict
+
+from bolid_jsonrpc import JsonRpcClientBase, JsonRpcMethodCallError
+
+from common.error_codes import error_name
+from common.stats import LatencyHistogram
+
+__all__ = [
+    "RpcMetrics",
+    "InstrumentedRpc",
+]
+
+
+class RpcMetrics:
+    def __init__(self):
+        """
+        Статистика вызовов RPC по методам: число вызовов, гистограмма задержек, ошибки (по именам ErrorCodes)
+        Включается присвоением Connection.METRICS = RpcMetrics()
+        """
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.errors: Dict[str, Dict[str, int]] = {}
+
+    def record(self, method: str, seconds: float, error: str = None):
+        histogram = self.histograms.get(method)
+        if histogram is None:
+            histogram = self.histograms[method] = LatencyHistogram()
+            self.errors[method] = {}
+        histogram.record(seconds)
+        if error is not None:
+            self.errors[method][error] = self.errors[method].get(error, 0) + 1
+
+    async def measure(self, method: str, call):
+        """ Выполнить корутину call, записав время и ошибку под именем method """
+        begin = time.perf_counter()
+        error = None
+        try:
+            return await call
+        except JsonRpcMethodCallError as ex:
+            error = error_name(ex.code)
+            raise
+        except Exception as ex:
+            error = type(ex).__name__
+            raise
+        finally:
+            self.record(method, time.perf_counter() - begin, error)
+
+    def merge(self, other: "RpcMetrics"):
+        for method, histogram in other.histograms.items():
+            if method not in self.histograms:
+                self.histograms[method] = LatencyHistogram(histogram.precision)
+                self.errors[method] = {}
+            self.histograms[method].merge(histogram)
+            for error, count in other.errors[method].items():
+                self.errors[method][error] = self.errors[method].get(error, 0) + count
+
+    def to_dict(self) -> dict:
+        return {
+            method: {
+                "summary": histogram.summary(),
+                "errors": self.errors[method],
+                "histogram": histogram.to_dict(),
+            }
+            for method, histogram in sorted(self.histograms.items())
+        }
+
+    def dump(self, path_to_file: str):
+        """ Сохранить статистику в json (summary - для чтения, histogram - для сравнения сборок) """
+        with open(path_to_file, "w", encoding="UTF-8") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+
+class InstrumentedRpc:
+    def __init__(self, client: JsonRpcClientBase, metrics: RpcMetrics):
+        """ Обертка над клиентом JSON-RPC: вызовы измеряются, остальные атрибуты - клиента """
+        self.client = client
+        self.metrics = metrics
+
+    async def __call__(self, method: str, *args, **kwargs):
+        return await self.metrics.measure(method, self.client(method, *args, **kwargs))
+
+    def __getattr__(self, name: str):
+        return getattr(self.client, name)
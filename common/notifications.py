@@ -0,0 +1,159 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Union, AsyncIterator
+
+from common.stats import LatencyHistogram
+
+__all__ = [
+    "Notification",
+    "NotificationStream",
+]
+
+
+class Notification:
+    def __init__(self, name: str, data: Any, received: float, latency: Optional[float]):
+        """
+        Уведомление JSON-RPC: имя, данные (как разобраны ловушкой), время прихода (time.perf_counter)
+        и задержка от последнего NotificationStream.mark() (None, если отметки не было)
+        """
+        self.name = name
+        self.data = data
+        self.received = received
+        self.latency = latency
+
+    def __repr__(self):
+        return f"Notification({self.name!r}, {self.data!r})"
+
+
+Predicate = Union[None, str, Callable[[Notification], bool]]
+
+
+def _matcher(predicate: Predicate) -> Callable[[Notification], bool]:
+    if predicate is None:
+        return lambda notification: True
+    if isinstance(predicate, str):
+        return lambda notification: notification.name == predicate
+    return predicate
+
+
+class NotificationStream:
+    # задержки доставки от действия (mark) всех буферов за прогон - по ним выбирается окно assert_quiet
+    RUN_LATENCY = LatencyHistogram()
+    QUIET_FACTOR = 4
+    QUIET_MIN_WINDOW = 0.5  # не меньше реального времени доставки по сети под нагрузкой
+    QUIET_MAX_WINDOW = 2.0
+    QUIET_MIN_SAMPLES = 20  # меньше замеров - p99 не оценить, окно QUIET_MAX_WINDOW
+
+    def __init__(self):
+        """
+        Буфер уведомлений соединения: сохраняются все уведомления по порядку прихода
+
+        attach - подписать буфер на уведомления соединения (ловушки register_notification_trap),
+        wait_for - дождаться count уведомлений, подходящих под условие, async for - перебор по мере прихода.
+        mark() - отметить момент действия, которое вызывает уведомления (вызывать прямо перед ним):
+        задержка доставки первого уведомления после отметки пишется в latency и RUN_LATENCY
+        """
+        self.events: List[Notification] = []
+        self.latency = LatencyHistogram()
+        self._mark: Optional[float] = None
+        self._measured = False  # задержка от текущей отметки уже записана
+        self._signal: Optional[asyncio.Future] = None
+
+    def attach(self, rpc, traps: Dict[str, Any]) -> "NotificationStream":
+        """ traps - {имя уведомления: тип данных}, как для register_notification_trap """
+        for name, data_type in traps.items():
+            rpc.register_notification_trap(self.on_event, {name: data_type})
+        return self
+
+    def on_event(self, name: str, data: Any):
+        received = time.perf_counter()
+        latency = None
+        if self._mark is not None:
+            latency = received - self._mark
+            if not self._measured:  # остальные уведомления рассылки - не задержка от действия
+                self._measured = True
+                self.latency.record(latency)
+                NotificationStream.RUN_LATENCY.record(latency)
+        self.events.append(Notification(name, data, received, latency))
+        if self._signal is not None and not self._signal.done():
+            self._signal.set_result(None)
+
+    def mark(self):
+        self._mark = time.perf_counter()
+        self._measured = False
+
+    def clear(self):
+        """ Забыть полученные уведомления (статистика задержек сохраняется) """
+        self.events.clear()
+        self._mark = None
+
+    def select(self, predicate: Predicate = None) -> List[Notification]:
+        match = _matcher(predicate)
+        return [notification for notification in self.events if match(notification)]
+
+    def data(self, predicate: Predicate = None) -> List[Any]:
+        return [notification.data for notification in self.select(predicate)]
+
+    def count(self, predicate: Predicate = None) -> int:
+        return len(self.select(predicate))
+
+    def _next_event(self) -> asyncio.Future:
+        if self._signal is None or self._signal.done():
+            self._signal = asyncio.get_event_loop().create_future()
+        return self._signal
+
+    async def _wait_next(self, deadline: float):
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise asyncio.TimeoutError()
+        # один future ждут несколько корутин - отмена по таймауту не должна его трогать
+        await asyncio.wait_for(asyncio.shield(self._next_event()), timeout)
+
+    async def wait_for(self, predicate: Predicate = None, count: int = 1, timeout: float = 5) -> List[Notification]:
+        """
+        Дождаться, пока в буфере будет не меньше count уведомлений под predicate
+        (имя уведомления или функция от Notification), иначе asyncio.TimeoutError. Вернет подходящие уведомления
+        """
+        match = _matcher(predicate)
+        deadline = time.monotonic() + timeout
+        checked = 0
+        matched: List[Notification] = []
+        while True:
+            if checked > len(self.events):  # буфер очищен во время ожидания
+                checked = 0
+                matched.clear()
+            matched.extend(notification for notification in self.events[checked:] if match(notification))
+            checked = len(self.events)
+            if len(matched) >= count:
+                return matched
+            await self._wait_next(deadline)
+
+    @classmethod
+    def quiet_window(cls) -> float:
+        """
+        Окно тишины: QUIET_FACTOR * p99 задержки доставки от действия за прогон
+        в пределах [QUIET_MIN_WINDOW, QUIET_MAX_WINDOW], пока замеров меньше QUIET_MIN_SAMPLES - QUIET_MAX_WINDOW
+        """
+        if cls.RUN_LATENCY.count < cls.QUIET_MIN_SAMPLES:
+            return cls.QUIET_MAX_WINDOW
+        window = cls.QUIET_FACTOR * cls.RUN_LATENCY.percentile(99)
+        return min(max(window, cls.QUIET_MIN_WINDOW), cls.QUIET_MAX_WINDOW)
+
+    async def assert_quiet(self, predicate: Predicate = None, window: Optional[float] = None):
+        """ Проверить, что новых уведомлений под predicate нет в течение window сек (по умолчанию quiet_window()) """
+        window = self.quiet_window() if window is None else window
+        before = self.count(predicate)
+        try:
+            matched = await self.wait_for(predicate, before + 1, window)
+        except asyncio.TimeoutError:
+            return
+        raise AssertionError(f"за {window:.3f} сек пришли уведомления: {matched[before:]}")
+
+    async def __aiter__(self) -> AsyncIterator[Notification]:
+        """ Все уведомления буфера, затем новые по мере прихода (без ограничения по времени) """
+        position = 0
+        while True:
+            while position < len(self.events):
+                position += 1
+                yield self.events[position - 1]
+            await asyncio.shield(self._next_event())
@@ -0,0 +1,120 @@
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Deque, Set, Tuple
+
+from common import Config, Connection
+
+__all__ = [
+    "ConnectionPool",
+]
+
+
+class ConnectionPool:
+    def __init__(self, config: Config, max_idle: int = 4):
+        """
+        Пул авторизованных соединений по имени пользователя
+
+        checkout - выдать соединение: свободное из пула (проверка Auth.User.whoami, сломанные выбрасываются)
+        или новое (start + login), checkin - вернуть в пул.
+        evict - не возвращать соединение в пул (например, на него подписаны ловушки уведомлений теста):
+        checkin его закроет.
+        Соединения пула не попадают в Connection.REGISTRY - их не закрывает close_all_connect,
+        а их идентификаторы закреплены в Connection.SESSION_IDS (pin)
+        Пользователи (кроме defaultUser) должны существовать в БД сервиса
+        """
+        self.config = config
+        self.max_idle = max_idle
+        self._idle: Dict[str, Deque[Connection]] = defaultdict(deque)
+        self._evicted: Set[int] = set()  # id соединений, которые checkin закроет
+        self.stats: Dict[str, int] = {"created": 0, "reused": 0, "evicted": 0}
+
+    def _credentials(self, name: str) -> Tuple[str, str]:
+        default_user = self.config.data.default_user
+        if name == default_user.name:
+            return default_user.name, default_user.password
+        for user in self.config.data.users:
+            if user.name == name:
+                return user.name, user.password
+        raise KeyError(f"пользователь {name} не найден в data")
+
+    async def _discard(self, connect: Connection):
+        """ Закрыть соединение пула, ошибки закрытия не важны """
+        try:
+            await connect.client.stop()
+        except Exception:
+            pass
+        Connection.SESSION_IDS.unpin(connect.session)
+
+    async def _create(self, name: str) -> Connection:
+        user_name, password = self._credentials(name)
+        kind = "admin" if user_name == self.config.data.default_user.name else "user"
+        connect = Connection(kind=kind)
+        Connection.SESSION_IDS.pin(connect.session)
+        try:
+            await connect.start(self.config.service.port)
+            Connection.REGISTRY.discard(connect.client)  # временем жизни управляет пул
+            await connect.login(user_name, password)
+        except Exception:
+            if connect.client is not None:
+                await self._discard(connect)
+            else:
+                Connection.SESSION_IDS.unpin(connect.session)
+            raise
+        self.stats["created"] += 1
+        return connect
+
+    async def _is_alive(self, connect: Connection) -> bool:
+        try:
+            return await connect.rpc("Auth.User.whoami") == connect.name
+        except Exception:
+            return False
+
+    async def checkout(self, name: str) -> Connection:
+        """ Выдать авторизованное соединение пользователя name """
+        idle = self._idle[name]
+        while idle:
+            connect = idle.popleft()
+            if await self._is_alive(connect):
+                self.stats["reused"] += 1
+                return connect
+            await self._discard(connect)
+            self.stats["evicted"] += 1
+        return await self._create(name)
+
+    async def checkout_role(self, role: str) -> Connection:
+        """ Выдать соединение первого пользователя из data.users с ролью role """
+        for user in self.config.data.users:
+            if user.role == role:
+                return await self.checkout(user.name)
+        raise KeyError(f"нет пользователя с ролью {role}")
+
+    def evict(self, connect: Connection):
+        """ Закрыть соединение при checkin вместо возврата в пул """
+        self._evicted.add(id(connect))
+
+    async def checkin(self, connect: Connection):
+        """ Вернуть соединение в пул """
+        idle = self._idle[connect.name]
+        if id(connect) in self._evicted:
+            self._evicted.discard(id(connect))
+            await self._discard(connect)
+            self.stats["evicted"] += 1
+        elif len(idle) >= self.max_idle:
+            await self._discard(connect)
+        else:
+            idle.append(connect)
+
+    @asynccontextmanager
+    async def acquire(self, name: str):
+        """ async with pool.acquire("admin") as connect: ... """
+        connect = await self.checkout(name)
+        try:
+            yield connect
+        finally:
+            await self.checkin(connect)
+
+    async def close(self):
+        """ Закрыть все свободные соединения """
+        for idle in self._idle.values():
+            while idle:
+                await self._discard(idle.popleft())
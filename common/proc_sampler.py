@@ -0,0 +1,154 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+__all__ = [
+    "ProcSample",
+    "ProcSampler",
+    "read_proc",
+]
+
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+class ProcSample:
+    def __init__(self, at: float, cpu: float, rss_kb: int, threads: int, fds: Optional[int],
+                 read_bytes: Optional[int], write_bytes: Optional[int]):
+        """
+        Снимок процесса из /proc: время (time.monotonic), процессорное время user+system (сек),
+        RSS (кБ), число потоков, открытых дескрипторов, прочитано/записано байт на диск
+        (None - нет прав на /proc/<pid>/fd или io)
+        """
+        self.at = at
+        self.cpu = cpu
+        self.rss_kb = rss_kb
+        self.threads = threads
+        self.fds = fds
+        self.read_bytes = read_bytes
+        self.write_bytes = write_bytes
+
+
+def _read(path: str) -> str:
+    with open(path, "r", encoding="ascii", errors="replace") as f:
+        return f.read()
+
+
+def _status(pid: int) -> Dict[str, str]:
+    fields = {}
+    for line in _read(f"/proc/{pid}/status").splitlines():
+        name, _, value = line.partition(":")
+        fields[name] = value.strip()
+    return fields
+
+
+def _io(pid: int) -> Dict[str, int]:
+    try:
+        return {name: int(value) for name, _, value in
+                (line.partition(": ") for line in _read(f"/proc/{pid}/io").splitlines())}
+    except PermissionError:
+        return {}
+
+
+def _fds(pid: int) -> Optional[int]:
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except PermissionError:
+        return None
+
+
+def read_proc(pid: int) -> Optional[ProcSample]:
+    """ Снимок процесса pid, None - процесса уже нет (или не Linux) """
+    try:
+        # поля после имени процесса "(comm)", с 3-го: utime - 14-е, stime - 15-е
+        stat = _read(f"/proc/{pid}/stat").rpartition(")")[2].split()
+        status = _status(pid)
+        io = _io(pid)
+        return ProcSample(
+            at=time.monotonic(),
+            cpu=(int(stat[11]) + int(stat[12])) / CLK_TCK,
+            rss_kb=int(status.get("VmRSS", "0 kB").split()[0]),
+            threads=int(status["Threads"]),
+            fds=_fds(pid),
+            read_bytes=io.get("read_bytes"),
+            write_bytes=io.get("write_bytes"),
+        )
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+
+
+def _delta(first: Optional[int], last: Optional[int]) -> Optional[int]:
+    return None if first is None or last is None else last - first
+
+
+class ProcSampler:
+    def __init__(self, pid: int, interval: float, max_samples: int = 10000):
+        """
+        Фоновый опрос /proc/<pid>/stat, status, io и fd раз в interval сек
+
+        Хранятся последние max_samples снимков, более старые вытесняются.
+        mark() - начало интервала (сквозной номер снимка), summary(mark) - приросты и пики с этого снимка
+        """
+        self.pid = pid
+        self.interval = interval
+        self.samples: Deque[ProcSample] = deque(maxlen=max_samples)
+        self.dropped = 0  # вытеснено снимков: номер samples[0]
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self) -> Optional[ProcSample]:
+        sample = read_proc(self.pid)
+        if sample is not None:
+            if len(self.samples) == self.samples.maxlen:
+                self.dropped += 1
+            self.samples.append(sample)
+        return sample
+
+    async def _run(self):
+        while self.sample() is not None:
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def mark(self) -> int:
+        self.sample()
+        return self.dropped + max(len(self.samples) - 1, 0)
+
+    def summary(self, since: int = 0) -> dict:
+        """
+        С снимка since до текущего: процессорное время (сек, % от одного ядра), пик и прирост RSS,
+        пик потоков и дескрипторов, прирост дескрипторов, прочитано/записано байт.
+        Если снимок since уже вытеснен - с самого старого из хранимых
+        """
+        self.sample()
+        samples = list(self.samples)[max(since - self.dropped, 0):]
+        if not samples:
+            return {}
+        first, last = samples[0], samples[-1]
+        wall = last.at - first.at
+        cpu = last.cpu - first.cpu
+        fds = [sample.fds for sample in samples if sample.fds is not None]
+        return {
+            "samples": len(samples),
+            "wall_s": round(wall, 3),
+            "cpu_s": round(cpu, 3),
+            "cpu_percent": round(100 * cpu / wall, 1) if wall > 0 else 0.0,
+            "rss_peak_kb": max(sample.rss_kb for sample in samples),
+            "rss_delta_kb": last.rss_kb - first.rss_kb,
+            "threads_peak": max(sample.threads for sample in samples),
+            "fds_peak": max(fds) if fds else None,
+            "fds_delta": _delta(first.fds, last.fds),
+            "read_bytes": _delta(first.read_bytes, last.read_bytes),
+            "write_bytes": _delta(first.write_bytes, last.write_bytes),
+        }
@@ -0,0 +1,72 @@
+from typing import Dict, List, Any
+
+__all__ = [
+    "ConnectionRegistry",
+]
+
+
+class ConnectionRegistry:
+    def __init__(self):
+        """
+        Открытые клиентские соединения по вложенным областям (сессия / модуль / тест)
+
+        add / discard - O(1), клиент регистрируется в текущей (верхней) области.
+        Клиент хранится до discard (Connection.stop) или до закрытия области: брошенный тестом
+        без stop клиент не пропадает из учета и будет закрыт.
+        push / pop - открыть / закрыть вложенную область, pop вернет оставшихся в ней клиентов (утечки)
+        """
+        self._scopes: List[Dict[int, Any]] = [{}]
+        self._names: List[str] = ["root"]
+        self._scope_of: Dict[int, Dict[int, Any]] = {}
+
+    def add(self, client):
+        self.discard(client)
+        scope = self._scopes[-1]
+        scope[id(client)] = client
+        self._scope_of[id(client)] = scope
+
+    def discard(self, client):
+        scope = self._scope_of.pop(id(client), None)
+        if scope is not None:
+            del scope[id(client)]
+
+    @property
+    def scope_name(self) -> str:
+        return self._names[-1]
+
+    def push(self, name: str):
+        self._scopes.append({})
+        self._names.append(name)
+
+    def pop(self, merge: bool = False) -> list:
+        """
+        Закрыть текущую область, вернет ее клиентов.
+        merge=False - они больше не учитываются, merge=True - переходят в родительскую область
+        """
+        if len(self._scopes) == 1:
+            raise RuntimeError("корневую область закрыть нельзя")
+        scope = self._scopes.pop()
+        self._names.pop()
+        clients = list(scope.values())
+        for key in scope:
+            del self._scope_of[key]
+        if merge:
+            for client in clients:
+                self.add(client)
+        return clients
+
+    def current(self) -> list:
+        """ Клиенты текущей области """
+        return list(self._scopes[-1].values())
+
+    def drain(self) -> list:
+        """ Забрать клиентов текущей области (область остается открытой и пустой) """
+        scope = self._scopes[-1]
+        clients = list(scope.values())
+        for key in scope:
+            del self._scope_of[key]
+        scope.clear()
+        return clients
+
+    def __len__(self) -> int:
+        return len(self._scope_of)
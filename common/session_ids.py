@@ -0,0 +1,95 @@
+from collections import deque
+from typing import Dict, Tuple, Set, Deque, Optional
+
+__all__ = [
+    "SessionIdAllocator",
+]
+
+
+class SessionIdAllocator:
+    # диапазоны идентификаторов клиента (client_id рукопожатия), границы включительно
+    RANGES: Dict[str, Tuple[int, int]] = {
+        "service": (1, 2999),
+        "admin": (3000, 3099),
+        "user": (3100, 4000),
+    }
+
+    def __init__(self, ranges: Optional[Dict[str, Tuple[int, int]]] = None):
+        """
+        Выдает и переиспользует идентификаторы сессий по диапазонам (service/admin/user)
+
+        allocate/release не содержат await - атомарны для задач одного цикла asyncio,
+        при параллельном запуске каждому воркеру выделяется свой поддиапазон (partition)
+        """
+        self.ranges: Dict[str, Tuple[int, int]] = dict(ranges or self.RANGES)
+        self._next: Dict[str, int] = {}
+        self._released: Dict[str, Deque[int]] = {}
+        self._in_use: Set[int] = set()
+        self._pinned: Set[int] = set()  # переживают release_all (соединения пула)
+        self.release_all()
+
+    def partition(self, index: int, count: int):
+        """ Оставить воркеру index из count его долю каждого диапазона """
+        for kind, (low, high) in self.ranges.items():
+            size = (high - low + 1) // count
+            if size == 0:
+                raise ValueError(f"диапазон {kind} {low}-{high} нельзя разделить на {count} воркеров")
+            self.ranges[kind] = (low + index * size, low + (index + 1) * size - 1)
+        self.release_all()
+
+    def _kind_of(self, session: int) -> Optional[str]:
+        for kind, (low, high) in self.ranges.items():
+            if low <= session <= high:
+                return kind
+        return None
+
+    def allocate(self, kind: str = "user") -> int:
+        """ Выдать свободный идентификатор из диапазона kind, сначала ранее освобожденные """
+        low, high = self.ranges[kind]
+        released = self._released[kind]
+        while released:
+            session = released.popleft()
+            if session not in self._in_use:
+                self._in_use.add(session)
+                return session
+        while self._next[kind] <= high:
+            session = self._next[kind]
+            self._next[kind] += 1
+            if session not in self._in_use:
+                self._in_use.add(session)
+                return session
+        raise OverflowError(f"закончились идентификаторы сессий {kind} ({low}-{high})")
+
+    def reserve(self, session: int):
+        """ Отметить занятым идентификатор, заданный вручную, уже занятый - ValueError """
+        if session in self._in_use:
+            raise ValueError(f"идентификатор сессии {session} уже занят")
+        self._in_use.add(session)
+
+    def release(self, session: int):
+        """ Вернуть идентификатор для повторного использования """
+        if session not in self._in_use:
+            return
+        self._in_use.discard(session)
+        kind = self._kind_of(session)
+        if kind is not None and session < self._next[kind]:
+            self._released[kind].append(session)
+
+    def pin(self, session: int):
+        """ Занять идентификатор так, чтобы его не освободил release_all """
+        self._pinned.add(session)
+        self._in_use.add(session)
+
+    def unpin(self, session: int):
+        self._pinned.discard(session)
+        self.release(session)
+
+    def release_all(self):
+        """ Освободить все идентификаторы (все соединения закрыты), кроме закрепленных """
+        self._in_use = set(self._pinned)
+        self._next = {kind: low for kind, (low, _) in self.ranges.items()}
+        self._released = {kind: deque() for kind in self.ranges}
+
+    @property
+    def in_use(self) -> int:
+        return len(self._in_use)
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import random
+import time
+from typing import Dict, Optional, TextIO
+
+from bolid_jsonrpc import JsonRpcMethodCallError
+
+from common import Config, Connection, Group, ConnectionsSnapshot, LatencyHistogram, error_name, read_proc
+from common.load import _user
+
+__all__ = [
+    "SOAK_OPERATIONS",
+    "SoakRunner",
+    "format_soak_report",
+]
+
+# шаги цикла жизни группы сессий в окнах отчета
+SOAK_OPERATIONS = ("login", "restore", "watch", "list", "drop", "logout")
+
+
+class _Window:
+    def __init__(self):
+        """ Статистика одного окна: гистограмма и ошибки по операциям """
+        self.begin = time.monotonic()
+        self.histograms: Dict[str, LatencyHistogram] = {op: LatencyHistogram() for op in SOAK_OPERATIONS}
+        self.errors: Dict[str, Dict[str, int]] = {op: {} for op in SOAK_OPERATIONS}
+
+    def record(self, op: str, seconds: float, error: Optional[str] = None):
+        self.histograms[op].record(seconds)
+        if error is not None:
+            self.errors[op][error] = self.errors[op].get(error, 0) + 1
+
+
+class SoakRunner:
+    def __init__(self, config: Config, population: int, duration: float, window: float, output: TextIO,
+                 group_size: int = 5, hold: float = 5, user_name: Optional[str] = None, pid: Optional[int] = None):
+        """
+        Длительная нагрузка: постоянно около population сессий пользователя user_name (по умолчанию первый из
+        data.users), population // group_size групп (Group), каждая по кругу: login + restore (Group.create),
+        Auth.Connections.watch, удержание ~hold сек, затем через раз Auth.Session.logout или
+        Auth.Connections.dropByGroup админом (группа - по Auth.Connections.list) и закрытие соединений.
+
+        Каждые window сек в output пишется строка JSON: пропускная способность, задержки и доля ошибок
+        по операциям за окно, число живых сессий (и RSS / дескрипторы процесса pid, если задан).
+        В памяти хранится только текущее окно
+        """
+        self.config = config
+        self.population = population
+        self.duration = duration
+        self.window = window
+        self.output = output
+        self.group_size = group_size
+        self.hold = hold
+        self.user = _user(config, user_name or config.data.users[0].name)  # нет такого - ValueError
+        self.pid = pid
+        self.alive = 0  # открытых сессий
+        self.windows = 0
+        self.totals: Dict[str, int] = {"ops": 0, "errors": 0}
+        self._current = _Window()
+
+    @staticmethod
+    async def _run(call) -> Optional[str]:
+        """ Выполнить корутину, вернет имя ошибки или None """
+        try:
+            await call
+        except JsonRpcMethodCallError as ex:
+            return error_name(ex.code)
+        except Exception as ex:
+            return type(ex).__name__
+        return None
+
+    async def _step(self, op: str, call) -> bool:
+        """ Выполнить шаг цикла, записать время; False - ошибка (цикл группы прерывается) """
+        begin = time.perf_counter()
+        error = await self._run(call)
+        self._current.record(op, time.perf_counter() - begin, error)
+        return error is None
+
+    async def _create(self, group: Group) -> bool:
+        """ Group.create: login первого соединения, restore остальных - в окно отдельными операциями """
+        begin = time.perf_counter()
+        error = await self._run(group.create(self.group_size, concurrency=self.group_size))
+        if error is not None:
+            self._current.record("login", time.perf_counter() - begin, error)
+            return False
+        self._current.record("login", group.timings["login"])
+        if self.group_size > 1:
+            self._current.record("restore", group.timings["restore"])
+        return True
+
+    async def _drop(self, admin: Connection, group: Group):
+        dropped = await admin.rpc("Auth.Connections.dropByGroup", group.id)
+        if dropped != self.group_size:
+            raise RuntimeError(f"Auth.Connections.dropByGroup разорвал {dropped} соединений из {self.group_size}")
+
+    async def _set_group_id(self, group: Group):
+        group.set_id((await ConnectionsSnapshot.fetch(group.connection[0])).this.group_id)
+
+    async def _cycle(self, admin: Connection, drop: bool):
+        group = Group(self.user, self.config.service.port)
+        begin = time.perf_counter()
+        created = False
+        try:
+            created = await self._create(group)
+            if created:
+                self.alive += self.group_size
+            if not created or not await self._step("watch", group.connection[0].rpc("Auth.Connections.watch", True)):
+                return
+            await asyncio.sleep(random.uniform(0, 2 * self.hold))
+            if drop:
+                if await self._step("list", self._set_group_id(group)):
+                    await self._step("drop", self._drop(admin, group))
+            else:
+                await self._step("logout", group.connection[0].rpc("Auth.Session.logout"))
+        finally:
+            await asyncio.gather(*[connect.stop() for connect in group.connection], return_exceptions=True)
+            if created:
+                self.alive -= self.group_size
+            if time.perf_counter() - begin < 0.01:  # сервис отвечает ошибкой сразу - не крутиться вхолостую
+                await asyncio.sleep(0.1)
+
+    async def _worker(self, admin: Connection, deadline: float):
+        drop = random.random() < 0.5
+        while time.monotonic() < deadline:
+            await self._cycle(admin, drop)
+            drop = not drop
+
+    def _flush_window(self, elapsed: float):
+        window, self._current = self._current, _Window()
+        seconds = max(time.monotonic() - window.begin, 1e-9)
+        ops = {}
+        count = errors = 0
+        for op, histogram in window.histograms.items():
+            if histogram.count == 0:
+                continue
+            op_errors = sum(window.errors[op].values())
+            ops[op] = dict(histogram.summary(),
+                           rps=histogram.count / seconds,
+                           error_rate=op_errors / histogram.count,
+                           errors=window.errors[op])
+            count += histogram.count
+            errors += op_errors
+        line = {"t": round(elapsed, 3), "window_s": round(seconds, 3), "alive": self.alive,
+                "rps": count / seconds, "error_rate": errors / count if count else 0.0, "ops": ops}
+        if self.pid is not None:
+            sample = read_proc(self.pid)
+            if sample is not None:
+                line.update(rss_kb=sample.rss_kb, fds=sample.fds)
+        self.output.write(json.dumps(line) + "\n")
+        self.output.flush()
+        self.windows += 1
+        self.totals["ops"] += count
+        self.totals["errors"] += errors
+
+    async def _reporter(self, begin: float):
+        while True:
+            await asyncio.sleep(self.window)
+            self._flush_window(time.monotonic() - begin)
+
+    async def run(self) -> dict:
+        admin = Connection(kind="admin")
+        await admin.start(self.config.service.port)
+        await admin.login(self.config.data.default_user.name, self.config.data.default_user.password)
+        begin = time.monotonic()
+        reporter = asyncio.create_task(self._reporter(begin))
+        try:
+            await asyncio.gather(*[self._worker(admin, begin + self.duration)
+                                   for _ in range(max(self.population // self.group_size, 1))])
+        finally:
+            reporter.cancel()
+            try:
+                await reporter
+            except asyncio.CancelledError:
+                pass
+            self._flush_window(time.monotonic() - begin)
+            await admin.stop()
+        return self.report(time.monotonic() - begin)
+
+    def report(self, elapsed: float) -> dict:
+        return {"elapsed": elapsed, "windows": self.windows, "ops": self.totals["ops"],
+                "errors": self.totals["errors"], "rps": self.totals["ops"] / elapsed}
+
+
+def format_soak_report(report: dict) -> str:
+    return (f"soak: {report['elapsed']:.1f} s, окон {report['windows']}, операций {report['ops']} "
+            f"({report['rps']:.1f} rps), ошибок {report['errors']}")
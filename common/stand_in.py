@@ -0,0 +1,419 @@
+import asyncio
+import re
+import secrets
+from typing import Dict, Optional, List, Callable, Any, Set, Iterable, Tuple
+
+from bolid_jsonrpc import JsonRpcMethodCallError
+from pydantic import BaseModel
+
+from common.error_codes import ErrorCodes
+
+__all__ = [
+    "StandInAuthService",
+    "StandInClient",
+]
+
+METHOD_NOT_FOUND = -32601
+ADMIN_ROLE = "admin"
+ROLES = [ADMIN_ROLE, "operator", "service"]
+LOGIN_PATTERN = re.compile(r"^[\w@\-.]{5,30}$")
+
+# причины Auth.Session.Down
+REASON_CLOSE = 0
+REASON_LOGOUT = 1
+REASON_DROP = 2
+REASON_PASSWORD = 3
+
+
+def _method_error(code: int, message: str) -> JsonRpcMethodCallError:
+    """ JsonRpcMethodCallError как от сервиса: тестам нужны только code и message """
+    error = JsonRpcMethodCallError.__new__(JsonRpcMethodCallError)
+    Exception.__init__(error, message)
+    error.code = code
+    error.message = message
+    return error
+
+
+def _access_denied() -> JsonRpcMethodCallError:
+    return _method_error(ErrorCodes.ACCESS_DENIED.value, "Access denied")
+
+
+def _invalid_argument() -> JsonRpcMethodCallError:
+    return _method_error(ErrorCodes.INVALID_ARGUMENT.value, "Invalid params")
+
+
+def _item_not_found() -> JsonRpcMethodCallError:
+    return _method_error(ErrorCodes.ITEM_NOT_FOUND.value, "Item not found")
+
+
+class _User:
+    def __init__(self, id: int, name: str, password: str, role: str):
+        self.id = id
+        self.name = name
+        self.password = password
+        self.role = role
+
+
+class _Peer:
+    """ Соединение на стороне сервиса """
+
+    def __init__(self, uid: int, client: "StandInClient"):
+        self.uid = uid
+        self.client = client
+        self.user: Optional[_User] = None
+        self.group: Optional[int] = None
+        self.auth_from: int = 0
+        self.watch = False
+        self.subscribed = False
+
+    def info(self, viewer: "_Peer") -> dict:
+        """ Элемент Auth.Connections.list / Auth.Connections.Event.Up """
+        return {
+            "uid": self.uid,
+            "groupId": self.group,
+            "host": self.client.host,
+            "userAgent": self.client.user_agent,
+            "self": self is viewer,
+            "authFrom": self.auth_from,
+            "user": {"name": self.user.name, "role": self.user.role},
+        }
+
+
+class StandInAuthService:
+    def __init__(self, app_config: dict, default_user_name: str, default_user_password: str,
+                 seed_users: Iterable[Any] = ()):
+        """
+        Заменитель auth_service в процессе теста (service.mode == "stand_in")
+
+        Реализует рукопожатие и методы Auth.* / Session.subscribe с уведомлениями поверх
+        клиента StandInClient, без сети и без процесса сервиса.
+        Поведение повторяет то, что проверяют тесты src/*_test.py
+        :param app_config: - конфиг приложения (core.trasted, core.role.default)
+        :param seed_users: - пользователи (User) исходного состояния, аналог БД-шаблона
+        """
+        self.trusted: Set[int] = set(app_config["core"]["trasted"])
+        self.default_role: str = app_config["core"]["role"]["default"]
+        self._default_user = (default_user_name, default_user_password)
+        self._seed_users = list(seed_users)
+        self._methods: Dict[str, Callable] = {
+            "Auth.Session.login": self._session_login,
+            "Auth.Session.restore": self._session_restore,
+            "Auth.Session.logout": self._session_logout,
+            "Session.subscribe": self._session_subscribe,
+            "Auth.User.whoami": self._user_whoami,
+            "Auth.User.add": self._user_add,
+            "Auth.User.create": self._user_create,
+            "Auth.User.nameList": self._user_name_list,
+            "Auth.User.Password.change": self._user_password_change,
+            "Auth.User.Role.set": self._user_role_set,
+            "Auth.User.Role.availableList": self._user_role_available_list,
+            "Auth.User.Role.getDefault": self._user_role_get_default,
+            "Auth.Connections.list": self._connections_list,
+            "Auth.Connections.watch": self._connections_watch,
+            "Auth.Connections.dropById": self._connections_drop_by_id,
+            "Auth.Connections.dropByGroup": self._connections_drop_by_group,
+            "Auth.Connections.dropByUser": self._connections_drop_by_user,
+        }
+        self.reset()
+
+    @staticmethod
+    def default_app_config() -> dict:
+        """ Конфиг приложения, если в service.config нет файла """
+        return {
+            "core": {"trasted": [1], "role": {"default": "operator"}, "db_path": ""},
+            "rpc": {"port": "0"},
+            "log": {"dir": "log", "systems": {}},
+        }
+
+    def reset(self):
+        """ Исходное состояние: только пользователь по умолчанию, соединений нет """
+        self.users: Dict[str, _User] = {}
+        self.peers: Dict[int, _Peer] = {}
+        self.groups: Dict[int, Dict[int, _Peer]] = {}
+        self.tokens: Dict[str, Tuple[int, _User]] = {}  # токен -> (группа, пользователь)
+        self._group_tokens: Dict[int, List[str]] = {}
+        self._next_uid = 1
+        self._next_group = 1
+        self.changed = False
+        self._add_user(*self._default_user, ADMIN_ROLE)
+        for user in self._seed_users:
+            self._add_user(user.name, user.password, user.role)
+
+    def client(self, client_id: int, host: str, user_agent: str) -> "StandInClient":
+        """ Клиент для Connection.start (аналог tcp_json_rpc_client) """
+        return StandInClient(self, client_id, host, user_agent)
+
+    # транспорт
+    def _attach(self, client: "StandInClient") -> _Peer:
+        peer = _Peer(self._next_uid, client)
+        self._next_uid += 1
+        self.peers[peer.uid] = peer
+        return peer
+
+    def _detach(self, peer: _Peer):
+        if self.peers.get(peer.uid) is not peer:  # соединение до reset: uid мог достаться новому
+            return
+        del self.peers[peer.uid]
+        if peer.user is not None:
+            self._deauth([peer], REASON_CLOSE, silent=())
+
+    def _call(self, peer: _Peer, method: str, args: tuple):
+        handler = self._methods.get(method)
+        if handler is None:
+            raise _method_error(METHOD_NOT_FOUND, f"Method not found: {method}")
+        return handler(peer, *args)
+
+    # вспомогательные
+    def _add_user(self, name: str, password: str, role: str) -> _User:
+        user = _User(len(self.users) + 1, name, password, role)
+        self.users[name] = user
+        return user
+
+    def _require_auth(self, peer: _Peer) -> _User:
+        if peer.user is None:
+            raise _access_denied()
+        return peer.user
+
+    def _require_admin(self, peer: _Peer):
+        if self._require_auth(peer).role != ADMIN_ROLE:
+            raise _access_denied()
+
+    @staticmethod
+    def _visible(viewer: _Peer, target: _Peer) -> bool:
+        return viewer.user.role == ADMIN_ROLE or viewer.user.name == target.user.name
+
+    def _authenticated(self) -> Iterable[_Peer]:
+        return [peer for peer in self.peers.values() if peer.user is not None]
+
+    def _auth(self, peer: _Peer, user: _User, group: int, auth_from: int):
+        if peer.user is not None:
+            if peer.group == group:
+                return
+            # переход в другую сессию: старую можно восстановить по ее токену
+            self._deauth([peer], REASON_CLOSE, silent=(peer,))
+        peer.user = user
+        peer.group = group
+        peer.auth_from = auth_from
+        self.groups.setdefault(group, {})[peer.uid] = peer
+        for watcher in self._authenticated():
+            if watcher is not peer and watcher.watch and self._visible(watcher, peer):
+                watcher.client.notify("Auth.Connections.Event.Up", peer.info(watcher))
+
+    def _deauth(self, peers: List[_Peer], reason: int, silent: Iterable[_Peer]):
+        """ Снять авторизацию, затем уведомить оставшихся: Event.Down (кроме silent), Session.Down """
+        ended = []
+        for peer in peers:
+            group = self.groups.get(peer.group)
+            if group is not None:
+                group.pop(peer.uid, None)
+                if not group:
+                    del self.groups[peer.group]
+                    ended.append((peer.group, peer.user))
+        down = [(peer.uid, peer.user, peer.group) for peer in peers if peer not in silent]
+        for peer in peers:
+            peer.user = None
+            peer.group = None
+            peer.watch = False
+
+        for uid, user, _ in down:
+            for watcher in self._authenticated():
+                if watcher.watch and (watcher.user.role == ADMIN_ROLE or watcher.user.name == user.name):
+                    watcher.client.notify("Auth.Connections.Event.Down", [uid])
+        for group, user in ended:
+            if reason != REASON_CLOSE:  # после разрыва соединения сессию можно восстановить по токену
+                for token in self._group_tokens.pop(group, []):
+                    del self.tokens[token]
+            sessions = [uid for uid, _, peer_group in down if peer_group == group]
+            self._session_notify("Auth.Session.Down",
+                                 {"reason": reason, "sessions": sessions, "user": {"id": user.id, "name": user.name}})
+
+    def _session_notify(self, name: str, data: dict):
+        for peer in self.peers.values():
+            if peer.subscribed:
+                peer.client.notify(name, data)
+
+    # Auth.Session
+    def _session_login(self, peer: _Peer, name: str, password: str) -> str:
+        user = self.users.get(name)
+        if user is None or user.password != password:
+            raise _access_denied()
+        group = self._next_group
+        self._next_group += 1
+        self._auth(peer, user, group, 0)
+        self._session_notify("Auth.Session.Up", {
+            "status": "up",
+            "user": {"id": user.id, "name": user.name},
+            "role": user.role,
+            "host": peer.client.host,
+            "userAgent": peer.client.user_agent,
+            "session": peer.client.client_id,
+        })
+        token = secrets.token_hex(16)
+        self.tokens[token] = (group, user)
+        self._group_tokens.setdefault(group, []).append(token)
+        return token
+
+    def _session_restore(self, peer: _Peer, token: str) -> str:
+        if not token:
+            raise _invalid_argument()
+        if token not in self.tokens:
+            raise _access_denied()
+        group, user = self.tokens[token]
+        self._auth(peer, user, group, 1)
+        return token
+
+    def _session_logout(self, peer: _Peer) -> bool:
+        self._require_auth(peer)
+        self._deauth(list(self.groups[peer.group].values()), REASON_LOGOUT, silent=(peer,))
+        return True
+
+    def _session_subscribe(self, peer: _Peer, enable: bool) -> bool:
+        if peer.client.client_id not in self.trusted:
+            raise _access_denied()
+        peer.subscribed = bool(enable)
+        return True
+
+    # Auth.User
+    def _user_whoami(self, peer: _Peer) -> str:
+        return self._require_auth(peer).name
+
+    def _user_add(self, peer: _Peer, name: str, password: str) -> bool:
+        return self._user_create(peer, name, password, "")
+
+    def _user_create(self, peer: _Peer, name: str, password: str, role: str) -> bool:
+        self._require_admin(peer)
+        if not LOGIN_PATTERN.match(name) or not 5 <= len(password) < 30:
+            raise _invalid_argument()
+        if role and role not in ROLES:
+            raise _invalid_argument()
+        if name in self.users:
+            return False
+        self._add_user(name, password, role or self.default_role)
+        self.changed = True
+        return True
+
+    def _user_name_list(self, peer: _Peer) -> List[str]:
+        self._require_admin(peer)
+        return list(self.users)
+
+    def _user_password_change(self, peer: _Peer, old_password: str, new_password: str) -> str:
+        user = self._require_auth(peer)
+        if user.password != old_password:
+            raise _access_denied()
+        if not 5 <= len(new_password) < 30:
+            raise _invalid_argument()
+        user.password = new_password
+        self.changed = True
+        peers = [other for other in self._authenticated() if other.user is user]
+        self._deauth(peers, REASON_PASSWORD, silent=())
+        return ""
+
+    def _user_role_set(self, peer: _Peer, name: str, role: str) -> bool:
+        self._require_admin(peer)
+        if role not in ROLES:
+            raise _invalid_argument()
+        user = self.users.get(name)
+        if user is None:
+            raise _item_not_found()
+        user.role = role
+        self.changed = True
+        return True
+
+    def _user_role_available_list(self, peer: _Peer) -> List[str]:
+        self._require_auth(peer)
+        return list(ROLES)
+
+    def _user_role_get_default(self, peer: _Peer) -> str:
+        self._require_auth(peer)
+        return self.default_role
+
+    # Auth.Connections
+    def _connections_list(self, peer: _Peer) -> List[dict]:
+        self._require_auth(peer)
+        return [other.info(peer) for other in self._authenticated() if self._visible(peer, other)]
+
+    def _connections_watch(self, peer: _Peer, enable: bool) -> bool:
+        self._require_auth(peer)
+        peer.watch = bool(enable)
+        return True
+
+    def _drop(self, peer: _Peer, targets: List[_Peer]) -> int:
+        targets = [target for target in targets if target is not peer]
+        self._deauth(targets, REASON_DROP, silent=())
+        return len(targets)
+
+    def _connections_drop_by_id(self, peer: _Peer, uid: int) -> bool:
+        self._require_auth(peer)
+        target = self.peers.get(uid)
+        if target is None or target.user is None or not self._visible(peer, target):
+            raise _item_not_found()
+        return self._drop(peer, [target]) == 1
+
+    def _connections_drop_by_group(self, peer: _Peer, group_id: int) -> int:
+        self._require_auth(peer)
+        targets = [target for target in self.groups.get(group_id, {}).values() if self._visible(peer, target)]
+        if not targets:
+            raise _item_not_found()
+        return self._drop(peer, targets)
+
+    def _connections_drop_by_user(self, peer: _Peer, name: str) -> int:
+        self._require_auth(peer)
+        targets = [target for target in self._authenticated()
+                   if target.user.name == name and self._visible(peer, target)]
+        if not targets:
+            raise _item_not_found()
+        return self._drop(peer, targets)
+
+
+class StandInClient:
+    def __init__(self, service: StandInAuthService, client_id: int, host: str, user_agent: str):
+        """ Клиент JSON-RPC заменителя сервиса: тот же интерфейс, что у JsonRpcClientBase, без сети """
+        self.service = service
+        self.client_id = client_id
+        self.host = host
+        self.user_agent = user_agent
+        self._peer: Optional[_Peer] = None
+        self._traps: Dict[str, List[Callable]] = {}
+        self._types: Dict[str, Any] = {}
+
+    async def connect(self) -> bool:
+        """ Рукопожатие """
+        await asyncio.sleep(0)
+        self._peer = self.service._attach(self)
+        return True
+
+    async def stop(self):
+        self.abort()
+
+    def abort(self):
+        """ Разорвать соединение сразу (close_clients - для зависших stop) """
+        if self._peer is not None:
+            self.service._detach(self._peer)
+            self._peer = None
+
+    async def __call__(self, method: str, *args):
+        await asyncio.sleep(0)  # как при обмене по сети - дать отработать уведомлениям
+        if self._peer is None or self.service.peers.get(self._peer.uid) is not self._peer:
+            raise ConnectionError("соединение закрыто")
+        return self.service._call(self._peer, method, args)
+
+    async def auth_login(self, user_name: str, user_password: str) -> str:
+        """ Аналог bolid_jsonrpc.auth_login """
+        return await self("Auth.Session.login", user_name, user_password)
+
+    def register_notification_trap(self, callback: Callable, trap: Dict[str, Any]):
+        for name, data_type in trap.items():
+            self._traps.setdefault(name, []).append(callback)
+            self._types[name] = data_type
+
+    def notify(self, name: str, data: Any):
+        """ Доставить уведомление в следующей итерации цикла событий """
+        callbacks = self._traps.get(name)
+        if not callbacks:
+            return
+        data_type = self._types[name]
+        if isinstance(data_type, type) and issubclass(data_type, BaseModel):
+            data = data_type.parse_obj(data)
+        loop = asyncio.get_event_loop()
+        for callback in callbacks:
+            loop.call_soon(callback, name, data)
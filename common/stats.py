@@ -0,0 +1,97 @@
+import math
+from typing import Dict, Optional
+
+__all__ = [
+    "LatencyHistogram",
+]
+
+
+class LatencyHistogram:
+    def __init__(self, precision: float = 0.01):
+        """
+        Гистограмма задержек с логарифмическими корзинами (как HDR histogram):
+        память не зависит от числа замеров, относительная погрешность квантилей ~precision
+
+        значения в секундах, внутри - микросекунды
+        """
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        self.counts: Dict[int, int] = {}
+        self.count: int = 0
+        self.total: float = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _index(self, seconds: float) -> int:
+        micros = seconds * 1e6
+        if micros <= 1:
+            return 0
+        return int(math.log(micros) / self._log_base) + 1
+
+    def _value(self, index: int) -> float:
+        """ Верхняя граница корзины, сек """
+        if index == 0:
+            return 1e-6
+        return math.exp(index * self._log_base) / 1e6
+
+    def record(self, seconds: float, count: int = 1):
+        """ Записать замер (count одинаковых замеров) """
+        index = self._index(seconds)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += seconds * count
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """ Квантиль (0-100), сек """
+        if self.count == 0:
+            return 0
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def merge(self, other: "LatencyHistogram"):
+        """ Добавить замеры другой гистограммы (той же точности) """
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def summary(self) -> dict:
+        """ count, mean, p50, p90, p99, max в миллисекундах """
+        return {
+            "count": self.count,
+            "mean_ms": (self.total / self.count * 1000) if self.count else 0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p90_ms": self.percentile(90) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": (self.max or 0) * 1000,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "precision": self.precision,
+            "counts": {str(index): count for index, count in self.counts.items()},
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LatencyHistogram":
+        histogram = cls(data["precision"])
+        histogram.counts = {int(index): count for index, count in data["counts"].items()}
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
@@ -1,8 +1,10 @@
 import os
 import json
+import socket
 
 __all__ = [
     'get_environ',
+    'get_free_port',
     'read_json_config',
     'write_file',
     'write_json_config',
@@ -14,6 +16,13 @@ def get_environ(param: str):
     return os.environ.get(param)
 
 
+def get_free_port() -> int:
+    """ Вернуть свободный tcp порт на localhost """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
 def read_json_config(path_to_file: str) -> dict:
     """ Прочитать конфиг"""
     with open(path_to_file, 'r', encoding="UTF-8") as f:
@@ -1,124 +1,52 @@
 import asyncio
 import logging
-import os
-from distutils.file_util import copy_file
 from json import JSONDecodeError
 from pathlib import *
 from typing import Optional, List
 
 import pytest
 
-from common import Config, read_json_config, write_json_config, get_environ, write_file, Connection, Group
-from src.connections_test import ConnectionEventHandler
-
-
-class Controller:
-    def __init__(self, config: Config):
-        """
-        Выполняет развертывание и запуск приложения
-
-        конструктор инициализирует конфиг теста
-        deploy	Копирование конфига и файла БД
-        path_config до настройки конфига
-        run запуск программы
-        """
-        self.proc: Optional[asyncio.subprocess.Process] = None
-        self.logger = None
-        self.tasks_read_task = None
-        self.timer = 1
-        self.config = config
-
-    def _copy_artifacts(self, to_folder_path: str):
-        """
-        Копировать артефакты
-        """
-        check_file = Path(to_folder_path).is_dir()  # проверить существует ли папка
-
-        if not check_file:  # если ее нет, создать
-            os.mkdir(to_folder_path)
-
-        copy_file(str(self.config.service.execute), to_folder_path)  # добавить исполняемый файл в work_dir
-        copy_file(str(self.config.service.db), to_folder_path)  # добавить файл базы данных в work_dir
-
-        # патч до конфига который нужно перенести
-        copy_file(str(self.config.service.config), to_folder_path)  # добавить конфигурацию приложения в work_dir
-
-    def path_config(self):
-        app_cfg = read_json_config(str(self.config.service.config))
-        app_cfg['log']['dir'] = 'log'
-        log_systems = app_cfg["log"]["systems"]
-        for key in log_systems.keys():
-            log_systems[key] = {"file": True, "level": "trace"}
-
-        # Нужно перепатчить конфиг на дб воркдира
-        app_cfg["core"]["db_path"] = str(Path.cwd().joinpath(self.config.work_dir, self.config.service.db.name))
-        app_cfg["rpc"]["port"] = str(self.config.service.port)
-        write_json_config(
-            str(self.config.work_dir.joinpath(self.config.service.config.name)),
-            app_cfg
-        )
-
-    def deploy(self):
-        """ Функция, которая будет разворачивать рабочее окружение """
-
-        try:
-            self._copy_artifacts(str(self.config.work_dir))
-        except Exception as e:
-            raise e
-
-    async def start(self):
-        """ Запустить процесс """
-
-        current_path = Path.cwd()
-        current_dir = current_path.joinpath(self.config.work_dir)  # сформировать с кур дир через патч
-        path_to_w_log = Path(current_dir, "log")
-        self.proc = await asyncio.create_subprocess_exec(
-            self.config.service.execute,
-            self.config.service.param_key, self.config.service.config.name,
-            cwd=str(current_dir),  # work dir з конфига
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        tasks = \
-            [asyncio.create_task(read_task(str(path_to_w_log.joinpath("log_stdout.txt")), self.proc.stdout)),
-             asyncio.create_task(read_task(str(path_to_w_log.joinpath("log_stderr.txt")), self.proc.stderr))]
-
-        self.tasks_read_task = asyncio.gather(
-            *tasks,
-        )
-
-    async def stop(self):
-        await asyncio.sleep(self.timer)
-        if self.proc.returncode is not None:
-            return
-        else:
-            self.proc.terminate()
-            try:
-                await asyncio.wait_for(self.proc.wait(), timeout=self.timer)
-            except asyncio.TimeoutError:
-                self.proc.kill()
-
-
-async def read_task(file_name: str, stream: asyncio.StreamReader):
-    while True:
-        data = await stream.readline()
-        if not data:
-            return
-        else:
-            line = str(data.decode(encoding="CP866")).replace("\n", "")
-            write_file(file_name, line)
+from common import Config, User, read_json_config, get_environ, get_free_port, Connection, Group, Controller, \
+    SessionIdAllocator, ConnectionPool, RpcMetrics, NotificationStream, CallResult, close_clients
 
+CLOSE_CONCURRENCY = 64  # одновременных stop при закрытии соединений теста
+CLOSE_TIMEOUT = 10  # общий срок закрытия, сек
 
-@pytest.fixture
-async def main():
-    def _out_tests_for_exception(exception_str):
-        pytest.exit(returncode=-1, reason=f"{exception_str}")
+# id клиентов, открытых в теле теста (а не фикстурами) и не закрытых к его концу
+TEST_CLIENTS = pytest.StashKey[set]()
+
+
+def pytest_addoption(parser):
+    parser.addoption("--rpc-metrics", default=None, metavar="PATH",
+                     help="собирать статистику вызовов rpc (Connection.METRICS) и сохранить в json")
+
+
+def pytest_configure(config):
+    if config.getoption("--rpc-metrics"):
+        Connection.METRICS = RpcMetrics()
 
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
 
+def pytest_sessionfinish(session):
+    path = session.config.getoption("--rpc-metrics")
+    if path and Connection.METRICS is not None:
+        worker_id = get_environ("PYTEST_XDIST_WORKER")
+        Connection.METRICS.dump(f"{path}.{worker_id}" if worker_id else path)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    """ Отдельная область Connection.REGISTRY на тело теста - отличить его соединения от соединений фикстур """
+    Connection.REGISTRY.push(f"{item.nodeid}::call")
+    yield
+    item.stash[TEST_CLIENTS] = {id(client) for client in Connection.REGISTRY.pop(merge=True)}
+
+
+def _out_tests_for_exception(exception_str):
+    pytest.exit(returncode=-1, reason=f"{exception_str}")
+
+
+def _load_config() -> Config:
+    """ Прочитать конфиг теста по переменной окружения JSONRPC_ITEST_CONFIG """
     config_from_json: Optional[dict] = None
     path_jsonrpc_config: str = get_environ("JSONRPC_ITEST_CONFIG")  # получить конфиг из среды окружения
 
@@ -137,6 +65,19 @@ async def main():
         _ex_message = none_type
         _out_tests_for_exception(_ex_message)
     config = Config(**config_from_json)  # распарсить словарь в модель Pydantic
+
+    # при параллельном запуске (pytest -n N) у каждого воркера свой порт, своя рабочая дирректория
+    # и свой поддиапазон идентификаторов сессий
+    worker_id = get_environ("PYTEST_XDIST_WORKER")
+    if worker_id:
+        config = config.for_worker(worker_id, get_free_port())
+        Connection.SESSION_IDS = SessionIdAllocator()
+        Connection.SESSION_IDS.partition(int(worker_id.lstrip("gw")), int(get_environ("PYTEST_XDIST_WORKER_COUNT")))
+    return config
+
+
+async def _start_controller(config: Config) -> Controller:
+    """ Развернуть и запустить сервис """
     controller = Controller(config)
 
     try:
@@ -146,34 +87,171 @@ async def main():
         _out_tests_for_exception(_ex_message)
 
     controller.path_config()  # пропатчить конфиг
+    await controller.prepare_template()  # БД-шаблон с data.population пользователями
     await controller.start()
-    await asyncio.sleep(3)
+    await controller.wait_ready()
+    return controller
+
+
+def _raise_failed(results: List[CallResult]):
+    """ Ошибки вызовов Connection.batch - одно исключение со списком неудавшихся вызовов """
+    errors = [result for result in results if result.error is not None]
+    if errors:
+        failed = ", ".join(f"{result.method}{tuple(result.args[:1])}: {result.error!r}" for result in errors)
+        raise RuntimeError(f"не выполнено вызовов: {len(errors)} из {len(results)} - {failed}") from errors[0].error
+
+
+async def _add_users(admin_connect: Connection, users: List[User]):
+    """ Добавить пользователей, затем роли - два конвейера (Connection.batch) вместо 2*N вызовов подряд """
+    added = await admin_connect.batch([('Auth.User.add', user.name, user.password) for user in users])
+    _raise_failed(added)  # Добавляем пользователей, ошибка - исключение
+    roles = await admin_connect.batch([("Auth.User.Role.set", user.name, user.role) for user in users])
+    _raise_failed(roles)  # добавляем роли
+
+
+async def _close_connections(request=None):
+    """
+    Закрыть открытые клиентские соединения текущей области Connection.REGISTRY:
+    параллельно, с общим сроком (зависшие прерываются)
+    :param request: - соединения, открытые в теле теста request.node, считаются его утечкой
+    (user_properties leaked_connections), соединения фикстур - нет
+    """
+    clients = Connection.REGISTRY.drain()
+    if request is not None:
+        owned = request.node.stash.get(TEST_CLIENTS, set())
+        leaked = [client for client in clients if id(client) in owned]
+        if leaked:
+            request.node.user_properties.append(("leaked_connections", len(leaked)))
+            logging.warning(f"{request.node.nodeid}: тест не закрыл соединений: {len(leaked)}")
+    stats = await close_clients(clients, CLOSE_CONCURRENCY, CLOSE_TIMEOUT)
+    if stats["forced"] or stats["failed"]:
+        logging.warning(f"закрытие соединений: {stats}")
+
+    Connection.SESSION_IDS.release_all()
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    """ Один цикл событий на сессию - нужен для фикстур со scope="session" """
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+async def service():
+    """
+    Сервис, запущенный один раз на всю сессию (service.scope == "session").
+    При service.scope == "function" вернет None - сервис разворачивается в main на каждый тест
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+
+    config = _load_config()
+    if config.service.scope != "session":
+        yield None
+        return
+
+    controller = await _start_controller(config)
+    yield controller
+
+    await controller.stop()
+
+
+def _proc_summary(controller: Controller, mark: Optional[int], request):
+    """ Нагрузка на процесс сервиса за тест (ProcSampler) - в user_properties service_proc """
+    if mark is None:
+        return
+    summary = controller.sampler.summary(mark)
+    request.node.user_properties.append(("service_proc", summary))
+    logging.info(f"{request.node.nodeid}: процесс сервиса {summary}")
+
+
+def _proc_mark(controller: Controller) -> Optional[int]:
+    return None if controller.sampler is None else controller.sampler.mark()
+
+
+@pytest.fixture(autouse=True)
+async def connection_scope(request):
+    """ Своя область Connection.REGISTRY на каждый тест, не закрытые к концу теста соединения - утечка """
+    Connection.REGISTRY.push(request.node.nodeid)
+    yield
+    await _close_connections(request)
+    Connection.REGISTRY.pop()
+
+
+@pytest.fixture
+async def main(service, request):
+    if service is not None:
+        mark = _proc_mark(service)
+        # передать управление тестам
+        yield service.config
+
+        _proc_summary(service, mark, request)
+        # вернуть сервис в исходное состояние для следующего теста
+        await _close_connections(request)
+        await service.reset()
+        return
+
+    config = _load_config()
+    controller = await _start_controller(config)
+    mark = _proc_mark(controller)
 
     # передать управление тестам
     yield config
 
+    _proc_summary(controller, mark, request)
     await controller.stop()
 
 
+@pytest.fixture(scope="session")
+async def session_pool(service):
+    """ Пул соединений на всю сессию (только при service.scope == "session") """
+    if service is None:
+        yield None
+        return
+
+    pool = ConnectionPool(service.config)
+    yield pool
+
+    await pool.close()
+
+
+@pytest.fixture
+async def connection_pool(main, session_pool):
+    """
+    Пул авторизованных соединений (ConnectionPool): async with connection_pool.acquire(name) as connect
+    При service.scope == "session" соединения переиспользуются между тестами
+    """
+    if session_pool is not None:
+        yield session_pool
+        return
+
+    pool = ConnectionPool(main)
+    yield pool
+
+    await pool.close()
+
+
 @pytest.fixture
 async def close_all_connect():
     """ Закрыть все соединения """
     yield
 
-    for connect in Connection.ALL_CONNECTS:
-        await connect.stop()
-
-    Connection.ALL_CONNECTS.clear()
+    await _close_connections()
 
 
 @pytest.fixture
-async def administrator_connect(main, close_all_connect):
-    """ Cоздает соединение администратора (Connection) """
+async def administrator_connect(main, connection_pool, close_all_connect):
+    """
+    Соединение администратора (Connection) из пула connection_pool.
+    Тест, который подписывает на него ловушки уведомлений, должен вызвать connection_pool.evict(admin)
+    """
     config = main
-    admin = Connection(session=3000)
-    await admin.start(config.service.port)
-    await admin.login(config.data.default_user.name, config.data.default_user.password)
-    yield admin, config
+    async with connection_pool.acquire(config.data.default_user.name) as admin:
+        yield admin, config
 
 
 # создает сервисное соединение(Connection) - service_connect
@@ -195,9 +273,7 @@ async def create_users(administrator_connect):
     admin_connect, config = administrator_connect
 
     # Создает пользователей из config.data.users, с помощью "админского" соединения
-    for user in config.data.users:
-        await admin_connect.rpc('Auth.User.add', user.name, user.password)  # Добавляем пользователей
-        await admin_connect.rpc("Auth.User.Role.set", user.name, user.role)  # добавляем роли
+    await _add_users(admin_connect, config.data.users)
     yield admin_connect, config
 
 
@@ -212,54 +288,33 @@ async def create_two_users(administrator_connect):
 
     two_users = config.data.users[:2]
 
-    for user in two_users:
-        await connection_admin.rpc('Auth.User.add', user.name, user.password)  # Добавляем пользователей
-        await connection_admin.rpc("Auth.User.Role.set", user.name, user.role)  # добавляем роли
+    await _add_users(connection_admin, two_users)
     yield connection_admin, config
 
 
 @pytest.fixture
-async def down_notify(create_users, close_all_connect):
+async def down_notify(create_users, connection_pool, close_all_connect):
     """ Дропнуть по группе оператора 1 .rpc("Auth.Connections.dropGroup", group_id) """
     admin_connect, config = create_users
+    connection_pool.evict(admin_connect)  # ловушки уведомлений этого теста - в пул не возвращать
     admin_connect: Optional[Connection]
     config: Optional[Config]
 
     #   Сделать 5 подключения пользователя с ролью operator.
     group_count_conn_5 = 5
     group = [Group(config.data.users[0], config.service.port)]
-    start_user_sessions = 3001
-    await group[0].create(group_count_conn_5, start_user_sessions)
+    await group[0].create(group_count_conn_5)
 
     #   Сделать подключение 2-го пользователя
-    operator_2_conn = Connection(session=(start_user_sessions + group_count_conn_5 + 1))
+    operator_2_conn = Connection()
     await operator_2_conn.start(config.service.port)
     await operator_2_conn.login(config.data.users[1].name, config.data.users[1].password)
 
-    #   Для оператора 1 - создать ивент хэндлер.
-    operator1_evt = ConnectionEventHandler()
-    operator1_evt.set_count_for_notification(4)
-
-    #   Для админа создать ивент хэндлер
-    admin_evt = ConnectionEventHandler()
-    admin_evt.set_count_for_notification(4)
-
-    #   Для оператора 2 - создать ивент хэндлер.
-    operator2_evt = ConnectionEventHandler()
-
-    #   Подписаться оператором 1 на уведомления
-    for_register_trap = [[operator1_evt.on_down, {"Auth.Connections.Event.Down": List[int]}]]
-
-    # привязать колбеки к Auth.Connections.Event.Up, к group[0].connection[0].rpc
-    [group[0].connection[0].rpc.register_notification_trap(*reg) for reg in for_register_trap]
-
-    #   Подписаться админом на уведомления
-    for_register_trap = [[admin_evt.on_down, {"Auth.Connections.Event.Down": List[int]}]]
-    [admin_connect.rpc.register_notification_trap(*reg) for reg in for_register_trap]
-
-    #   Подписаться оператором 2 на уведомления
-    for_register_trap = [[operator2_evt.on_down, {"Auth.Connections.Event.Down": List[int]}]]
-    [operator_2_conn.rpc.register_notification_trap(*reg) for reg in for_register_trap]
+    #   Буферы уведомлений Auth.Connections.Event.Down: оператор 1 (group[0].connection[0]), админ, оператор 2
+    down_trap = {"Auth.Connections.Event.Down": List[int]}
+    operator1_evt = NotificationStream().attach(group[0].connection[0].rpc, down_trap)
+    admin_evt = NotificationStream().attach(admin_connect.rpc, down_trap)
+    operator2_evt = NotificationStream().attach(operator_2_conn.rpc, down_trap)
 
     # Для сессии user[0] оператора1 - Подписаться на уведомления.
     await group[0].connection[0].rpc("Auth.Connections.watch", True)
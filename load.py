@@ -0,0 +1,175 @@
+"""
+Нагрузочные прогоны auth_service
+
+    SET JSONRPC_ITEST_CONFIG=config.json
+    python load.py closed --concurrency 50 --duration 30 --mix login=1,restore=2,whoami=8,logout=1
+    python load.py fanout --watchers 1,10,50 --sizes 10,100,500 --modes group,user
+    python load.py --start leak --scenario drop_group --iterations 200
+    python load.py --start soak --population 200 --duration 14400 --window 10 --out soak.jsonl
+    python load.py open --rates 500,1000,2000,4000 --duration 10 --mix login=1,restore=4,list=4
+    python load.py --processes 4 closed --concurrency 400 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from typing import Optional, List
+
+from common import Config, Controller, LoadGenerator, read_json_config, get_environ, parse_mix, format_report, \
+    provision_user, FanoutBenchmark, format_fanout_report, LeakDetector, format_leak_report, SoakRunner, \
+    format_soak_report, OpenLoopGenerator, format_open_loop_report, OPEN_LOOP_METHODS, ShardedLoad
+
+
+def _load_config(path: Optional[str]) -> Config:
+    return Config(**read_json_config(path or get_environ("JSONRPC_ITEST_CONFIG")))
+
+
+async def _start_service(config: Config) -> Controller:
+    """ Развернуть и запустить сервис """
+    controller = Controller(config)
+    controller.deploy()
+    controller.path_config()
+    await controller.prepare_template()
+    await controller.start()
+    await controller.wait_ready()
+    return controller
+
+
+async def run_closed(args: argparse.Namespace, config: Config, _: Optional[Controller]) -> dict:
+    await provision_user(config, args.user or config.data.default_user.name)
+    params = dict(mix=parse_mix(args.mix), concurrency=args.concurrency, duration=args.duration, user_name=args.user)
+    if args.processes > 1:
+        return await ShardedLoad(config, args.processes).run("closed", params)
+    return await LoadGenerator(config, **params).run()
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",")]
+
+
+async def run_open(args: argparse.Namespace, config: Config, _: Optional[Controller]) -> dict:
+    await provision_user(config, args.user or config.data.default_user.name)
+    return await OpenLoopGenerator.sweep(config, parse_mix(args.mix, OPEN_LOOP_METHODS),
+                                         [float(rate) for rate in args.rates.split(",")], args.duration,
+                                         args.connections, args.user, args.knee_p99_factor, args.processes)
+
+
+async def run_fanout(args: argparse.Namespace, config: Config, _: Optional[Controller]) -> dict:
+    user_name = args.user or config.data.users[0].name
+    await provision_user(config, user_name)
+    benchmark = FanoutBenchmark(config, _int_list(args.watchers), _int_list(args.sizes), args.modes.split(","),
+                                args.repeat, user_name)
+    return await benchmark.run()
+
+
+def _service_pid(args: argparse.Namespace, controller: Optional[Controller]) -> int:
+    if args.pid:
+        return args.pid
+    if controller is None:
+        raise SystemExit("leak: нужен --start или --pid процесса сервиса")
+    # stand_in - сервис в этом процессе
+    return os.getpid() if controller.is_stand_in else controller.proc.pid
+
+
+async def run_leak(args: argparse.Namespace, config: Config, controller: Optional[Controller]) -> dict:
+    user_name = args.user or config.data.users[0].name
+    await provision_user(config, user_name)
+    detector = LeakDetector(config, _service_pid(args, controller), args.scenario, args.iterations, args.warmup,
+                            args.size, user_name, args.max_rss_kb, args.max_fds)
+    return await detector.run()
+
+
+async def run_soak(args: argparse.Namespace, config: Config, controller: Optional[Controller]) -> dict:
+    user_name = args.user or config.data.users[0].name
+    await provision_user(config, user_name)
+    pid = _service_pid(args, controller) if args.pid or controller is not None else None
+    with open(args.out, "a", encoding="UTF-8") as output:
+        soak = SoakRunner(config, args.population, args.duration, args.window, output, args.group_size, args.hold,
+                          user_name, pid)
+        return await soak.run()
+
+
+async def main(args: argparse.Namespace):
+    config = _load_config(args.config)
+    controller = await _start_service(config) if args.start else None
+    try:
+        report = await args.run(args, config, controller)
+    finally:
+        if controller is not None:
+            await controller.stop()
+
+    print(args.format(report))
+    if args.json:
+        with open(args.json, "w", encoding="UTF-8") as f:
+            json.dump(report, f, indent=4)
+    if report.get("passed") is False:
+        raise SystemExit(1)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Нагрузка на auth_service")
+    parser.add_argument("--config", help="конфиг теста (по умолчанию JSONRPC_ITEST_CONFIG)")
+    parser.add_argument("--start", action="store_true", help="развернуть и запустить сервис (Controller)")
+    parser.add_argument("--json", help="сохранить отчет в json файл")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="closed и open: разделить нагрузку между процессами (свой цикл asyncio и client_id)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    closed = commands.add_parser("closed", help="замкнутая нагрузка: запрос - ответ - следующий запрос")
+    closed.add_argument("--concurrency", type=int, default=10, help="число одновременных соединений")
+    closed.add_argument("--duration", type=float, default=10, help="длительность, сек")
+    closed.add_argument("--mix", default="login=1,restore=2,whoami=8,logout=1",
+                        help="веса операций login/restore/whoami/logout")
+    closed.add_argument("--user", help="имя пользователя из data.users (по умолчанию defaultUser)")
+    closed.set_defaults(run=run_closed, format=format_report)
+
+    open_loop = commands.add_parser("open", help="открытая нагрузка: запросы с постоянной частотой, "
+                                                 "перебор частот и поиск колена")
+    open_loop.add_argument("--rates", default="100,200,500,1000,2000",
+                           help="частоты, запросов в секунду, через запятую")
+    open_loop.add_argument("--duration", type=float, default=10, help="длительность на каждой частоте, сек")
+    open_loop.add_argument("--mix", default="login=1,restore=4,list=4", help="веса операций login/restore/list")
+    open_loop.add_argument("--connections", type=int, default=16, help="число соединений (конвейер)")
+    open_loop.add_argument("--knee-p99-factor", type=float, default=5,
+                           help="колено: p99 не больше этого множителя от p99 на самой низкой частоте")
+    open_loop.add_argument("--user", help="имя пользователя из data.users (по умолчанию defaultUser)")
+    open_loop.set_defaults(run=run_open, format=format_open_loop_report)
+
+    fanout = commands.add_parser("fanout", help="задержка Event.Down от числа подписчиков и размера группы")
+    fanout.add_argument("--watchers", default="1,10,50", help="число админских соединений с watch, через запятую")
+    fanout.add_argument("--sizes", default="10,100,500", help="размеры сбрасываемой группы, через запятую")
+    fanout.add_argument("--modes", default="group,user", help="способы сброса: group (dropByGroup), user (dropByUser)")
+    fanout.add_argument("--repeat", type=int, default=3, help="число сбросов на каждое сочетание")
+    fanout.add_argument("--user", help="имя пользователя группы из data.users (по умолчанию первый)")
+    fanout.set_defaults(run=run_fanout, format=format_fanout_report)
+
+    leak = commands.add_parser("leak", help="повтор сценария на одном сервисе, рост RSS и дескрипторов на итерацию")
+    leak.add_argument("--scenario", default="drop_group", help="drop_group (Group.create -> dropByGroup) "
+                                                               "или login_logout")
+    leak.add_argument("--iterations", type=int, default=200, help="число измеряемых итераций")
+    leak.add_argument("--warmup", type=int, default=10, help="итераций прогрева (не измеряются)")
+    leak.add_argument("--size", type=int, default=5, help="соединений в итерации")
+    leak.add_argument("--user", help="имя пользователя из data.users (по умолчанию первый)")
+    leak.add_argument("--pid", type=int, help="pid процесса сервиса (без --start)")
+    leak.add_argument("--max-rss-kb", type=float, default=4, help="порог роста RSS, кБ на итерацию")
+    leak.add_argument("--max-fds", type=float, default=0.05, help="порог роста числа дескрипторов на итерацию")
+    leak.set_defaults(run=run_leak, format=format_leak_report)
+
+    soak = commands.add_parser("soak", help="длительная нагрузка: постоянное число сессий, login/restore/watch/"
+                                            "drop/logout по кругу, окна статистики в json lines")
+    soak.add_argument("--population", type=int, default=100, help="число одновременных сессий")
+    soak.add_argument("--group-size", type=int, default=5, help="сессий в группе (Group)")
+    soak.add_argument("--hold", type=float, default=5, help="среднее время жизни группы, сек")
+    soak.add_argument("--duration", type=float, default=3600, help="длительность, сек")
+    soak.add_argument("--window", type=float, default=10, help="окно статистики, сек")
+    soak.add_argument("--out", required=True, help="файл json lines (дописывается)")
+    soak.add_argument("--user", help="имя пользователя из data.users (по умолчанию первый)")
+    soak.add_argument("--pid", type=int, help="pid процесса сервиса - RSS и дескрипторы в окнах (без --start)")
+    soak.set_defaults(run=run_soak, format=format_soak_report)
+    return parser
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(main(build_parser().parse_args()))
@@ -1,12 +1,11 @@
-import asyncio
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 import pytest
 from bolid_jsonrpc import JsonRpcMethodCallError
 from pydantic import BaseModel
 
-from common import ErrorCodes, read_json_config, User, Connection, Config
+from common import ErrorCodes, read_json_config, User, Connection, Config, NotificationStream
 
 """ Проверка уведомлений авторизации """
 
@@ -31,45 +30,16 @@ class AuthSessionDown(BaseModel):
     user: UserData
 
 
-class SessionNotifyHandler:
-    def __init__(self):
-        self._down = None
-        self._up = None
-        self._evt = asyncio.Event()
-
-    def clear(self):
-        self._down = None
-        self._up = None
-        self._evt.clear()
-
-    def on_up(self, _: str, data: AuthSessionUp):
-        self._up = data
-        self._evt.set()
-
-    def on_down(self, _: str, data: AuthSessionDown):
-        self._down = data
-        self._evt.set()
-
-    async def wait_down(self, timeout: int) -> AuthSessionDown:
-        await asyncio.wait_for(self._evt.wait(), timeout)
-        return self._down
-
-    async def wait_up(self, timeout: int) -> AuthSessionUp:
-        """ Вызвать clear() до вызова метода """
-        await asyncio.wait_for(self._evt.wait(), timeout)
-        return self._up
-
-
 async def test_session_notify(create_two_users):
     """ Служебное соединение подключается к сервису с идентификатором описанном в конфиге приложения(сервиса)
         core.trasted - не совсем понял - уточню
     """
 
-    async def create_connect(client_id: int, _user: User = None) -> Connection:
+    async def create_connect(client_id: Optional[int], _user: User = None) -> Connection:
 
         # Создаем подключение с данными авторизации пользователя
-        """ Создаем подключение """
-        client_conn = Connection(session=int(client_id))
+        """ Создаем подключение, client_id None - свободный идентификатор из диапазона user """
+        client_conn = Connection(session=None if client_id is None else int(client_id))
         connect = await client_conn.start(config.service.port)
         assert True or False is connect
 
@@ -91,14 +61,10 @@ async def test_session_notify(create_two_users):
     _core_trusted: int = read_json_config(str(path))["core"]["trasted"][0]
     service_connect: Connection = await create_connect(_core_trusted)
     subscribe: bool = await service_connect.rpc("Session.subscribe", True)
-    checker: SessionNotifyHandler = SessionNotifyHandler()
-
-    for_register_trap = [
-        [checker.on_up, {"Auth.Session.Up": AuthSessionUp}],
-        [checker.on_down, {"Auth.Session.Down": AuthSessionDown}],
-    ]
-
-    [service_connect.rpc.register_notification_trap(*reg) for reg in for_register_trap]
+    checker = NotificationStream().attach(service_connect.rpc, {
+        "Auth.Session.Up": AuthSessionUp,
+        "Auth.Session.Down": AuthSessionDown,
+    })
 
     assert subscribe is True, "подписались"
     """ 
@@ -109,13 +75,15 @@ async def test_session_notify(create_two_users):
     timeout = 10
 
     checker.clear()
-    connect1 = await create_connect(3002, config.data.users[0])
-    up_data = await checker.wait_up(timeout)
+    checker.mark()
+    connect1 = await create_connect(None, config.data.users[0])
+    up_data = (await checker.wait_for("Auth.Session.Up", timeout=timeout))[0].data
     assert config.data.users[0].name == up_data.user.name, "Имена совпадают"
 
     checker.clear()
-    connect2 = await create_connect(3003, config.data.users[1])
-    up_data2 = await checker.wait_up(timeout)
+    checker.mark()
+    connect2 = await create_connect(None, config.data.users[1])
+    up_data2 = (await checker.wait_for("Auth.Session.Up", timeout=timeout))[0].data
 
     # Проверить что имена совпадают
     assert config.data.users[1].name == up_data2.user.name, "Имена совпадают"
@@ -128,8 +96,9 @@ async def test_session_notify(create_two_users):
     """
 
     checker.clear()
+    checker.mark()
     await connect1.stop()
-    down_data = await checker.wait_down(timeout)
+    down_data = (await checker.wait_for("Auth.Session.Down", timeout=timeout))[0].data
     assert config.data.users[0].name == down_data.user.name, "Имена совпадают"
 
     """
@@ -27,9 +27,9 @@ async def test_create_user_and_connect_him(administrator_connect):
     assert create_user_role is True, "роль добавлена"
 
     # [1 коннект] подключиться новым пользователем Session.login
-    connection_user1 = Connection(session=3001)
+    connection_user1 = Connection()
     test_connect1 = await connection_user1.start(config.service.port)
-    connection_user2 = Connection(session=3002)
+    connection_user2 = Connection()
     test_connect2 = await connection_user2.start(config.service.port)
 
     assert True or False is test_connect1 and test_connect2, "соединение выполнено под новым пользователем (не " \
@@ -58,8 +58,6 @@ async def test_create_user_and_connect_him(administrator_connect):
         await connection_user2.rpc("Auth.Session.restore", "")
     assert ex.value.code == ErrorCodes.INVALID_ARGUMENT.value, 'запрос должен вернуть ошибку "Invalid params"'
 
-CONST_CLIENT_ID: int = random.randint(3001, 4000)
-
 
 async def test_add_users(administrator_connect):
     """
@@ -71,9 +69,9 @@ async def test_add_users(administrator_connect):
     5 Отключение соединения	Проверка события Auth.Session.Down
     """
 
-    async def create_connect(_user: User, client_id):
+    async def create_connect(_user: User):
         """ Создаем подключение """
-        client_conn = Connection(session=int(client_id))
+        client_conn = Connection()
         connect = await client_conn.start(config.service.port)
         assert True or False is connect
         req_get_token = await client_conn.login(_user.name, _user.password)
@@ -107,8 +105,8 @@ async def test_add_users(administrator_connect):
 
     # Создаем параллельные коннекты с данными авторизации из data.defaultUser
     # Проверка успешной авторизации и событий Auth.Session.Up
-    for i, user in enumerate(config.data.users):
-        await asyncio.create_task(create_connect(user, CONST_CLIENT_ID + i))
+    for user in config.data.users:
+        await asyncio.create_task(create_connect(user))
 
     # Проверить что есть коннект
     for user_conn in connects:
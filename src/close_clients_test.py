@@ -0,0 +1,61 @@
+import asyncio
+
+from common import close_clients
+
+""" Параллельное закрытие клиентов с общим сроком (close_clients) """
+
+
+class _Client:
+    def __init__(self, hang: bool = False, fail: bool = False):
+        """ Клиент с управляемым stop: зависает или падает """
+        self.hang = hang
+        self.fail = fail
+        self.stopped = False
+        self.aborted = False
+
+    async def stop(self):
+        if self.hang:
+            await asyncio.sleep(3600)
+        if self.fail:
+            raise ConnectionError("stop failed")
+        self.stopped = True
+
+    def abort(self):
+        self.aborted = True
+
+
+class _Transport:
+    def __init__(self):
+        self.aborted = False
+
+    def abort(self):
+        self.aborted = True
+
+
+class _TransportClient:
+    def __init__(self):
+        """ Клиент без abort, но с транспортом asyncio """
+        self.transport = _Transport()
+
+    async def stop(self):
+        await asyncio.sleep(3600)
+
+
+async def test_close_clients_stats():
+    clients = [_Client(), _Client(), _Client(fail=True)]
+
+    stats = await close_clients(iter(clients), concurrency=2, timeout=1)
+    assert stats == {"closed": 2, "failed": 1, "forced": 0}
+    assert not any(client.aborted for client in clients), "закрытые вовремя не прерываются"
+
+
+async def test_close_clients_aborts_stragglers():
+    done = _Client()
+    hung = _Client(hang=True)
+    hung_transport = _TransportClient()
+
+    stats = await close_clients([done, hung, hung_transport], timeout=0.05)
+    assert stats == {"closed": 1, "failed": 0, "forced": 2}
+    assert hung.aborted, "зависший stop отменен, соединение закрыто abort клиента"
+    assert hung_transport.transport.aborted, "без abort клиента закрывается его транспорт"
+    assert not done.aborted
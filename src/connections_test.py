@@ -1,10 +1,16 @@
-import asyncio
 from typing import List, Optional
 
 import pytest
 from bolid_jsonrpc import JsonRpcMethodCallError
 
-from common import Connection, AuthConnectionsInfo, Group, ErrorCodes, Config
+from common import Connection, AuthConnectionsInfo, ConnectionsSnapshot, ConnectionsMirror, Group, ErrorCodes, \
+    Config, NotificationStream
+
+
+def _mark(*streams: NotificationStream):
+    """ Отметить момент действия, вызывающего уведомления, - прямо перед ним """
+    for stream in streams:
+        stream.mark()
 
 
 async def test_get_list(create_users):
@@ -13,8 +19,8 @@ async def test_get_list(create_users):
     # создать по 1 соединению по данным config.data.users (операторские соединения - массив Connection)
     users_connects = []
 
-    for client_session, user in enumerate(config.data.users):
-        _conn = Connection(session=(3001 + int(client_session)))
+    for user in config.data.users:
+        _conn = Connection()
         await _conn.start(config.service.port)
         token = await _conn.login(user.name, user.password)
         assert len(token) > 0, "токен не должен быть пустым"
@@ -47,7 +53,7 @@ async def test_get_list(create_users):
         assert rslt.user.name == connect.name, "должны совпадать"
 
     # создать еще одно соединение с данными config.data.users[0]
-    new_con = Connection(session=(3001 + len(users_connects)))
+    new_con = Connection()
     await new_con.start(config.service.port)
     await new_con.login(
         config.data.users[0].name, config.data.users[0].password
@@ -83,9 +89,9 @@ async def test_drop_by_id(create_users, close_all_connect):
     # создать список операторских соединений
     connection = []
 
-    for client_session, user in enumerate(config.data.users):
+    for user in config.data.users:
         if user.role == "operator":
-            _conn = Connection(session=(3001 + client_session))
+            _conn = Connection()
             await _conn.start(config.service.port)
             await _conn.login(user.name, user.password)
             connection.append(_conn)
@@ -119,7 +125,7 @@ async def test_drop_by_id(create_users, close_all_connect):
                                                              "Item not found"
 
 
-async def test_drop_by_group(create_users, close_all_connect):
+async def test_drop_by_group(create_users, connection_pool, close_all_connect):
     admin_connect, config = create_users
 
     # Создать две группы соединений(Group)
@@ -129,37 +135,37 @@ async def test_drop_by_group(create_users, close_all_connect):
         Group(config.data.users[0], config.service.port),
         Group(config.data.users[1], config.service.port)
     ]
-    start_user_sessions = 3001
-    await group[0].create(group_count_conn_1, start_user_sessions)
-    await group[1].create(group_count_conn_2, start_user_sessions + group_count_conn_1)
+    await group[0].create(group_count_conn_1)
+    await group[1].create(group_count_conn_2)
 
     # получить список соединений, через админа
-    list_session_info = [AuthConnectionsInfo(**info) for info in await admin_connect.rpc("Auth.Connections.list")]
-    for_test_5_id_users = [x.user.name for x in list_session_info if x.user.name == group[0].user.name]
-    for_test_3_id_users = [x.user.name for x in list_session_info if x.user.name == group[1].user.name]
-    assert len(for_test_5_id_users) == group_count_conn_1, "сверить что 5 элементов списка в группе (извлечь его " \
-                                                           "groupId)"
-    assert len(for_test_3_id_users) == group_count_conn_2, "сверить что 3 элементов списка в группе (извлечь его " \
-                                                           "groupId)"
-    group[0].set_id([x.group_id for x in list_session_info if x.user.name == group[0].user.name][0])
-    group[1].set_id([x.group_id for x in list_session_info if x.user.name == group[1].user.name][0])
+    snapshot = await ConnectionsSnapshot.fetch(admin_connect)
+    assert snapshot.count_user(group[0].user.name) == group_count_conn_1, \
+        "сверить что 5 элементов списка в группе (извлечь его groupId)"
+    assert snapshot.count_user(group[1].user.name) == group_count_conn_2, \
+        "сверить что 3 элементов списка в группе (извлечь его groupId)"
+    group[0].set_id(snapshot.group_id_of(group[0].user.name))
+    group[1].set_id(snapshot.group_id_of(group[1].user.name))
 
     with pytest.raises(JsonRpcMethodCallError) as ex:
         await group[0].connection[0].rpc('Auth.Connections.dropByGroup', group[1].id)
     assert ex.value.code == ErrorCodes.ITEM_NOT_FOUND.value, "проверить что выходит ошибка ITEM_NOT_FOUND"
 
+    connection_pool.evict(admin_connect)  # ловушки уведомлений зеркала - в пул не возвращать
     # admin_connect запрос: Auth.Connections.dropByGroup(group[1].id) - вернет 3
+    mirror = await ConnectionsMirror(admin_connect).start()
+    assert mirror.count_group(group[1].id) == group_count_conn_2
     assert await admin_connect.rpc("Auth.Connections.dropByGroup", group[1].id) == 3, "вернет 3"
-    list_session_info = [AuthConnectionsInfo(**info) for info in await admin_connect.rpc("Auth.Connections.list")]
+    await mirror.wait_group_empty(group[1].id, 3)
+    await mirror.stop()
+    assert len(mirror) == 6, "копия списка по уведомлениям Event.Down - 6 соединений"
+    after_drop = await ConnectionsSnapshot.fetch(admin_connect)
 
     # admin_connect перезапросить список Auth.Connections.list -  вернет 6 соединений(админское и пять операторских)
-    assert len(list_session_info) == 6, "должен вернуть 6 соединений"
-    checker_admin_len_con = [info_admin for info_admin in list_session_info
-                             if info_admin.user.name == admin_connect.name]
-    assert len(checker_admin_len_con) == 1, "проверить что 1 соединение администратора"
-    checker_operators_len_con = [operators_info for operators_info in list_session_info
-                                 if operators_info.user.name != admin_connect.name]
-    assert len(checker_operators_len_con) == 5, "проверить что 5 операторских"
+    assert len(after_drop) == 6, "должен вернуть 6 соединений"
+    assert after_drop.count_user(admin_connect.name) == 1, "проверить что 1 соединение администратора"
+    assert len(after_drop) - after_drop.count_user(admin_connect.name) == 5, "проверить что 5 операторских"
+    assert len(snapshot.diff(after_drop).removed) == 3, "пропали 3 соединения группы group[1]"
 
 
 async def test_drop_by_user(create_users, close_all_connect):
@@ -178,23 +184,21 @@ async def test_drop_by_user(create_users, close_all_connect):
         Group(config.data.users[0], config.service.port),
         Group(config.data.users[1], config.service.port)
     ]
-    start_user_sessions = 3001
-    await group[0].create(group_count_conn_1, start_user_sessions)
-    await group[1].create(group_count_conn_2, start_user_sessions + group_count_conn_1)
+    await group[0].create(group_count_conn_1)
+    await group[1].create(group_count_conn_2)
 
     #           Создать отдельное соединение с данными config.data.user[0] - op_conn
-    op_conn = Connection(session=(start_user_sessions + group_count_conn_1 + group_count_conn_2))
+    op_conn = Connection()
     await op_conn.start(config.service.port)
     await op_conn.login(config.data.users[0].name, config.data.users[0].password)
 
     #           Выгрузить список через admin_connect - результат 9
-    list_session_info = [AuthConnectionsInfo(**info) for info in await admin_connect.rpc("Auth.Connections.list")]
-    assert len(list_session_info) == 10, "Выгрузить список через admin_connect - результат 10"
+    snapshot = await ConnectionsSnapshot.fetch(admin_connect)
+    assert len(snapshot) == 10, "Выгрузить список через admin_connect - результат 10"
 
     #           Попытаться грохнуть чужое соединение(без полномочий)
-    list_session_info = [AuthConnectionsInfo(**info) for info in await admin_connect.rpc("Auth.Connections.list")]
-    group[0].set_id([x.group_id for x in list_session_info if x.user.name == group[0].user.name][0])
-    group[1].set_id([x.group_id for x in list_session_info if x.user.name == group[1].user.name][0])
+    group[0].set_id(snapshot.group_id_of(group[0].user.name))
+    group[1].set_id(snapshot.group_id_of(group[1].user.name))
 
     # group[0].connection[0].rpc('Auth.Connections.dropByUser', config.data.defaultUser.name) - ошибка ITEM_NOT_FOUND
     with pytest.raises(JsonRpcMethodCallError) as ex:
@@ -212,144 +216,92 @@ async def test_drop_by_user(create_users, close_all_connect):
 
     # ЗАРЕПОРТИТЬ - test_drop_by_user строка 250, попытка сделать запрос Auth.Connections.dropByUser с параметром user1
     # возвращает ошибку с 0 кодом и пустым сообщением.
-    users_count = len([AuthConnectionsInfo(**info) for info in await admin_connect.rpc("Auth.Connections.list")])
+    users_count = len(await ConnectionsSnapshot.fetch(admin_connect))
     assert users_count == 5, "должно остаться 5 пользователей "
 
     #       Админское соединение Auth.Connections.dropByName(config.data.user[0].name) == 1
     assert await admin_connect.rpc("Auth.Connections.dropByUser", config.data.users[0].name) == 1
 
     #       Админское соединение перезапросить список соединений
-    list_session_info = [AuthConnectionsInfo(**info) for info in await admin_connect.rpc("Auth.Connections.list")]
+    snapshot = await ConnectionsSnapshot.fetch(admin_connect)
 
     # Должен остаться админ(с признаком this == True)
-    assert [au_info for au_info in list_session_info if au_info.user.name == admin_connect.name][0].this is True
+    assert snapshot.this.user.name == admin_connect.name
 
     # И 3 операторских соединения с именем config.data.user[1]
-    assert len([operator_info for operator_info in list_session_info
-                if operator_info.user.role == "operator"]) == 3, "Проверить что осталось 3 " \
-                                                                 "операторских события "
-
-
-class ConnectionEventHandler:
-    def __init__(self):
-        self.count: Optional[int] = None
-        self.evt = asyncio.Event()
-        self.elements_up_data: List[AuthConnectionsInfo] = []
-        self.elements_down_data: List = []
-
-    def clear(self):
-        self.elements_up_data.clear()
-        self.elements_down_data.clear()
-        self.evt.clear()
-        self.count = None
-
-    def set_count_for_notification(self, count: int):
-        self.count = count
+    assert snapshot.count_role("operator") == 3, "Проверить что осталось 3 операторских события "
 
-    def on_up(self, _: str, data: AuthConnectionsInfo):
-        self.elements_up_data.append(data)
-        if self.count:
-            if self.count == len(self.elements_up_data):
-                self.evt.set()
 
-    def on_down(self, _: str, data: int):
-        self.elements_down_data.append(data)
-        if self.count:
-            if self.count == len(self.elements_down_data):
-                self.evt.set()
-
-    async def wait_down(self, timeout: int):
-        await asyncio.wait_for(self.evt.wait(), timeout)
-
-    async def wait_up(self, timeout: int):
-        """ Вызвать clear() до вызова метода """
-        await asyncio.wait_for(self.evt.wait(), timeout)
-
-
-async def test_up_notify(create_users, close_all_connect):
+async def test_up_notify(create_users, connection_pool, close_all_connect):
     admin_connect, config = create_users
     admin_connect: Optional[Connection]
     config: Optional[Config]
+    connection_pool.evict(admin_connect)  # ловушки уведомлений этого теста - в пул не возвращать
 
-    # Класс ConnectionEventHandler отслеживающий уведомления
-    # (аналогичный, который использовали для Auth.Session.Up|Down)
-    #     Auth.Connections.Event.Up
-    #     Auth.Connections.Event.Down
-    #             Вместо asyncio.Event использовать asyncio.Queue
-    admin_evt = ConnectionEventHandler()  # "Создать экземпляр ConnectionEventHandler(admin_evt)
-
-    # adm_subscribe = await admin_connect.rpc("Auth.Connections.watch", 1)
-    # # подписаться на уведомления(админское соединение)"
-    for_register_trap = [[admin_evt.on_up, {"Auth.Connections.Event.Up": AuthConnectionsInfo}]]
-    [admin_connect.rpc.register_notification_trap(*reg) for reg in for_register_trap]
+    # Буфер уведомлений Auth.Connections.Event.Up админского соединения
+    up_trap = {"Auth.Connections.Event.Up": AuthConnectionsInfo}
+    admin_evt = NotificationStream().attach(admin_connect.rpc, up_trap)
     adm_subscribe = await admin_connect.rpc("Auth.Connections.watch", True)
     assert adm_subscribe is True, "Админское соединение Auth.Connections.watch(true)"
 
     # Создать группу соединений(5) по c данными data.user[0]
     group_count_conn_5 = 5
-    admin_evt.set_count_for_notification(group_count_conn_5)
+    admin_evt.mark()
     group = [Group(config.data.users[0], config.service.port)]
-    start_user_sessions = 3001
-    await group[0].create(group_count_conn_5, start_user_sessions)
+    await group[0].create(group_count_conn_5)
 
     #               проверить, что в очереди admin_evt.up 5 элементов
     #               имя data.user[0].name
-    await admin_evt.wait_up(3)
-    assert len(admin_evt.elements_up_data) == group_count_conn_5, "проверить, что в очереди admin_evt.up 5 элементов"
-    assert config.data.users[0].name == admin_evt.elements_up_data[-1].user.name, "имя data.user[0].name"
+    await admin_evt.wait_for(count=group_count_conn_5, timeout=3)
+    assert admin_evt.count() == group_count_conn_5, "проверить, что в очереди admin_evt.up 5 элементов"
+    assert config.data.users[0].name == admin_evt.data()[-1].user.name, "имя data.user[0].name"
     admin_evt.clear()
-    admin_evt.set_count_for_notification(2)
 
-    # создать ConnectionEventHandle operator_evt,
-    operator_evt = ConnectionEventHandler()
-    operator_evt.set_count_for_notification(1)
-    for_register_trap = [[operator_evt.on_up, {"Auth.Connections.Event.Up": AuthConnectionsInfo}]]
-
-    # привязать колбеки к Auth.Connections.Event.Up, к group[0].connection[0].rpc
-    [group[0].connection[0].rpc.register_notification_trap(*reg) for reg in for_register_trap]
+    # буфер operator_evt на Auth.Connections.Event.Up соединения group[0].connection[0]
+    operator_evt = NotificationStream().attach(group[0].connection[0].rpc, up_trap)
     operator_subscribe = await group[0].connection[0].rpc("Auth.Connections.watch", True)
     assert operator_subscribe is True, "group[0].connection[0]: Auth.Connections.watch(true)"
 
     #  создать соединение с данными (data.user[0])
-    new_conn_user_0 = Connection(session=(start_user_sessions + group_count_conn_5))
+    admin_evt.mark()
+    operator_evt.mark()
+    new_conn_user_0 = Connection()
     await new_conn_user_0.start(config.service.port)
     await new_conn_user_0.login(config.data.users[0].name, config.data.users[0].password)
 
     # создать соединение с данными (data.user[1])
-    new_conn_user_1 = Connection(session=(start_user_sessions + group_count_conn_5 + 1))
+    new_conn_user_1 = Connection()
     await new_conn_user_1.start(config.service.port)
     await new_conn_user_1.login(config.data.users[1].name, config.data.users[1].password)
 
     # Проверить что
     #         operator_evt(1 элемент в очереди, имя data.user[0].name)
     #         admin_evt(2 элемента, [data.user[0].name, data.user[1].name])
-    await operator_evt.wait_up(3)
-    assert len(operator_evt.elements_up_data) == 1, "operator_evt(1 элемент в очереди, имя data.user[0].name)"
-    assert operator_evt.elements_up_data[-1].user.name == config.data.users[0].name
-    await admin_evt.wait_up(3)
-    assert len(admin_evt.elements_up_data) == 2, "2 элемента"
-    assert admin_evt.elements_up_data[0].user.name == config.data.users[0].name, "admin_evt == data.user[0].name"
-    assert admin_evt.elements_up_data[1].user.name == config.data.users[1].name, "admin_evt == data.user[1].name"
+    await operator_evt.wait_for(count=1, timeout=3)
+    assert operator_evt.count() == 1, "operator_evt(1 элемент в очереди, имя data.user[0].name)"
+    assert operator_evt.data()[-1].user.name == config.data.users[0].name
+    await admin_evt.wait_for(count=2, timeout=3)
+    assert admin_evt.count() == 2, "2 элемента"
+    assert admin_evt.data()[0].user.name == config.data.users[0].name, "admin_evt == data.user[0].name"
+    assert admin_evt.data()[1].user.name == config.data.users[1].name, "admin_evt == data.user[1].name"
     operator_evt.clear()
-    operator_evt.set_count_for_notification(1)
     admin_evt.clear()
-    admin_evt.set_count_for_notification(0)
 
     admin_off_subscribe = await admin_connect.rpc("Auth.Connections.watch", False)
     assert admin_off_subscribe is True, "проверить что мы отписались от уведомлений, " \
                                         "должно вернуться True (изменение применилось)"
 
     # Создать соединение с данными data.user[0]
-    new_conn_user_3 = Connection(session=(start_user_sessions + group_count_conn_5 + 2))
+    new_conn_user_3 = Connection()
     await new_conn_user_3.start(config.service.port)
     await new_conn_user_3.login(config.data.users[0].name, config.data.users[0].password)
 
     # проверить что в очереди
     #         operator_evt(1 элемент в очереди, имя data.user[0].name)
     #         admin_evt  пустая
-    await operator_evt.wait_up(3)
-    assert len(operator_evt.elements_up_data) == 1, "operator_evt(1 элемент в очереди, имя data.user[0].name)"
-    assert len(admin_evt.elements_up_data) == 0, "admin_evt  пустая"
+    await operator_evt.wait_for(count=1, timeout=3)
+    assert operator_evt.count() == 1, "operator_evt(1 элемент в очереди, имя data.user[0].name)"
+    assert admin_evt.count() == 0, "admin_evt  пустая"
 
 
 async def test_down_notify_by_user(down_notify):
@@ -358,19 +310,20 @@ async def test_down_notify_by_user(down_notify):
     operator_1_id_name_5 = group[0].user.name
 
     # Дропнуть по имени оператора 1 .rpc("Auth.Connections.dropByUser", "user_name")
+    _mark(operator1_evt, admin_evt, operator2_evt)
     await group[0].connection[0].rpc("Auth.Connections.dropByUser", operator_1_id_name_5)
 
-    await operator1_evt.wait_down(4)
-    assert len(operator1_evt.elements_down_data) == 4, "Проверить что у оператора 1 - пришло 4 уведомления"
+    await operator1_evt.wait_for(count=4, timeout=4)
+    assert operator1_evt.count() == 4, "Проверить что у оператора 1 - пришло 4 уведомления"
 
     # проверки - что Для админа прилетают уведомления Event.down
-    await admin_evt.wait_down(4)
-    assert len(admin_evt.elements_down_data) == 4, "Проверить что админу пришло 4 события Event.Down"
+    await admin_evt.wait_for(count=4, timeout=4)
+    assert admin_evt.count() == 4, "Проверить что админу пришло 4 события Event.Down"
 
     # проверка, что для юзера 2 не прилетают уведомления Event.down
-    await asyncio.sleep(2)
-    assert len(operator2_evt.elements_down_data) == 0, "проверить что второму пользователю не пришли уведомления " \
-                                                       "после действий первого пользователя"
+    await operator2_evt.assert_quiet()
+    assert operator2_evt.count() == 0, "проверить что второму пользователю не пришли уведомления " \
+                                       "после действий первого пользователя"
 
 
 async def test_down_notify_by_group(down_notify):
@@ -383,43 +336,43 @@ async def test_down_notify_by_group(down_notify):
     ][0].group_id
 
     # Отключить сессию 0 оператора 1 .stop
+    _mark(operator1_evt, admin_evt, operator2_evt)
     await group[0].connection[4].stop()
 
     # Дропнуть по группе оператора 1 .rpc("Auth.Connections.dropGroup", group_id)
+    _mark(operator1_evt, admin_evt, operator2_evt)
     await group[0].connection[0].rpc("Auth.Connections.dropByGroup", operator_1_group_id)
 
-    await operator1_evt.wait_down(4)
-    assert len(operator1_evt.elements_down_data) == 4, "Проверить что у оператора 1 - пришло 4 уведомления"
+    await operator1_evt.wait_for(count=4, timeout=4)
+    assert operator1_evt.count() == 4, "Проверить что у оператора 1 - пришло 4 уведомления"
 
     # проверки - что Для админа прилетают уведомления Event.down
-    await admin_evt.wait_down(4)
-    assert len(admin_evt.elements_down_data) == 4, "Проверить что админу пришло 4 события Event.Down"
+    await admin_evt.wait_for(count=4, timeout=4)
+    assert admin_evt.count() == 4, "Проверить что админу пришло 4 события Event.Down"
 
     # проверка, что для юзера 2 не прилетают уведомления Event.down
-    await asyncio.sleep(2)
-    assert len(operator2_evt.elements_down_data) == 0, "Проверить что второму пользователю не пришли уведомления " \
-                                                       "после действий первого пользователя"
+    await operator2_evt.assert_quiet()
+    assert operator2_evt.count() == 0, "Проверить что второму пользователю не пришли уведомления " \
+                                       "после действий первого пользователя"
 
 
 async def test_down_notify_logout(down_notify):
     group, operator1_evt, admin_evt, operator2_evt, _, _ = down_notify
 
-    # От логиниться всем соединениям кроме 0 - группы оператора 1 logout
-    operator1_evt.set_count_for_notification(0)
-
     # От логиниться от всех соединений
+    _mark(operator1_evt, admin_evt, operator2_evt)
     test = await group[0].connection[1].rpc("Auth.Session.logout")
     assert test is True
 
     # проверки - что Для админа прилетают уведомления Event.down
-    await admin_evt.wait_down(4)
-    assert len(admin_evt.elements_down_data) == 4, "Проверить что админу пришло 4 события Event.Down"
+    await admin_evt.wait_for(count=4, timeout=4)
+    assert admin_evt.count() == 4, "Проверить что админу пришло 4 события Event.Down"
 
     # проверка, что для юзера 2 не прилетают уведомления Event.down
-    await asyncio.sleep(2)
-    assert len(operator2_evt.elements_down_data) == 0, "проверить что второму пользователю не пришли уведомления " \
-                                                       "после действий первого пользователя"
-    assert len(operator1_evt.elements_down_data) == 0, "Проверить что у оператора 1 - пришло 1 уведомления"
+    await operator2_evt.assert_quiet()
+    assert operator2_evt.count() == 0, "проверить что второму пользователю не пришли уведомления " \
+                                       "после действий первого пользователя"
+    assert operator1_evt.count() == 0, "Проверить что у оператора 1 - пришло 1 уведомления"
     # погасить свое и проверить что пришел false
 
 
@@ -427,22 +380,23 @@ async def test_down_notify_stop(down_notify):
     group, operator1_evt, admin_evt, operator2_evt, _, _ = down_notify
 
     # Отключить сессию 0 оператора 1 .stop
+    _mark(operator1_evt, admin_evt, operator2_evt)
     i = 4
     while i > 0:
         await group[0].connection[i].stop()
         i -= 1
 
-    await operator1_evt.wait_down(4)
-    assert len(operator1_evt.elements_down_data) == 4, "Проверить что у оператора 1 - пришло 4 уведомления"
+    await operator1_evt.wait_for(count=4, timeout=4)
+    assert operator1_evt.count() == 4, "Проверить что у оператора 1 - пришло 4 уведомления"
 
     # проверки - что Для админа прилетают уведомления Event.down
-    await admin_evt.wait_down(4)
-    assert len(admin_evt.elements_down_data) == 4, "Проверить что админу пришло 4 события Event.Down"
+    await admin_evt.wait_for(count=4, timeout=4)
+    assert admin_evt.count() == 4, "Проверить что админу пришло 4 события Event.Down"
 
     # проверка, что для юзера 2 не прилетают уведомления Event.down
-    await asyncio.sleep(2)
-    assert len(operator2_evt.elements_down_data) == 0, "проверить что второму пользователю не пришли уведомления " \
-                                                       "после действий первого пользователя"
+    await operator2_evt.assert_quiet()
+    assert operator2_evt.count() == 0, "проверить что второму пользователю не пришли уведомления " \
+                                       "после действий первого пользователя"
 
 
 async def test_down_notify_by_id(down_notify):
@@ -461,16 +415,15 @@ async def test_down_notify_by_id(down_notify):
                         [AuthConnectionsInfo(**obj) for obj in await admin_conn.rpc("Auth.Connections.list")]]
         return sorted(all_list_uid)[0] - 1
 
-    # Указать для оператора 1, что ждем 1 уведомление
-    operator1_evt.set_count_for_notification(3)
-
     # Создать еще одну админскую (2-ю сессию)
-    admin2_conn = Connection(session=3056)
+    admin2_conn = Connection(kind="admin")
     await admin2_conn.start(config.service.port)
     await admin2_conn.login(config.data.default_user.name, config.data.default_user.password)
 
     # дропнуть ее другим админом - + 1 (для админа1)
-    drop_admin2 = await admin_connect.rpc("Auth.Connections.dropById", await get_current_uid_session(admin2_conn))
+    admin2_uid = await get_current_uid_session(admin2_conn)
+    _mark(operator1_evt, admin_evt, operator2_evt)
+    drop_admin2 = await admin_connect.rpc("Auth.Connections.dropById", admin2_uid)
     assert drop_admin2 is True, "Проверить что ок"
 
     # дропнуть юзером -> админа - ошибка ITEM_NOT_FOUND
@@ -479,13 +432,15 @@ async def test_down_notify_by_id(down_notify):
     assert ex.value.code == ErrorCodes.ITEM_NOT_FOUND.value, "проверить что выходит ошибка ITEM_NOT_FOUND"
 
     # админом дропнуть юзера по id [4] -> True
-    drop_user_conn = await admin_connect.rpc("Auth.Connections.dropById",
-                                             await get_current_uid_session(group[0].connection[4]))
+    user_uid = await get_current_uid_session(group[0].connection[4])
+    _mark(operator1_evt, admin_evt, operator2_evt)
+    drop_user_conn = await admin_connect.rpc("Auth.Connections.dropById", user_uid)
     assert drop_user_conn is True, "проверить что результат ок"
 
     # админом дропнуть юзера по id [3] -> True
-    drop_user_conn = await admin_connect.rpc("Auth.Connections.dropById",
-                                             await get_current_uid_session(group[0].connection[3]))
+    user_uid = await get_current_uid_session(group[0].connection[3])
+    _mark(operator1_evt, admin_evt, operator2_evt)
+    drop_user_conn = await admin_connect.rpc("Auth.Connections.dropById", user_uid)
     assert drop_user_conn is True, "проверить что результат ок"
 
     # Юзером дропнуть не существующего пользователя -> ITEM_NOT_FOUND
@@ -501,7 +456,7 @@ async def test_down_notify_by_id(down_notify):
     assert ex.value.code == ErrorCodes.ITEM_NOT_FOUND.value, "проверить что выходит ошибка ITEM_NOT_FOUND"
 
     # создать 2-ий коннект оператора 2
-    operator_2_2_conn = Connection(session=3060)
+    operator_2_2_conn = Connection()
     await operator_2_2_conn.start(config.service.port)
     await operator_2_2_conn.login(config.data.users[1].name, config.data.users[1].password)
 
@@ -511,21 +466,22 @@ async def test_down_notify_by_id(down_notify):
     assert ex.value.code == ErrorCodes.ITEM_NOT_FOUND.value, "проверить что выходит ошибка ITEM_NOT_FOUND"
 
     # в группе соединений оператора 1 [0] : соединением - сбросить соединение 2
-    req = await group[0].connection[0].rpc("Auth.Connections.dropById",
-                                           await get_current_uid_session(group[0].connection[1]))
+    user_uid = await get_current_uid_session(group[0].connection[1])
+    _mark(operator1_evt, admin_evt, operator2_evt)
+    req = await group[0].connection[0].rpc("Auth.Connections.dropById", user_uid)
     assert req is True, "проверить что ок"
 
-    await operator1_evt.wait_down(4)
-    assert len(operator1_evt.elements_down_data) == 3, "Проверить что у оператора 1 - пришло 4 уведомления"
+    await operator1_evt.wait_for(count=3, timeout=4)
+    assert operator1_evt.count() == 3, "Проверить что у оператора 1 - пришло 4 уведомления"
 
     # проверки - что Для админа прилетают уведомления Event.down
-    await admin_evt.wait_down(4)
-    assert len(admin_evt.elements_down_data) == 4, "Проверить что админу пришло 4 события Event.Down"
+    await admin_evt.wait_for(count=4, timeout=4)
+    assert admin_evt.count() == 4, "Проверить что админу пришло 4 события Event.Down"
 
     # проверка, что для юзера 2 не прилетают уведомления Event.down
-    await asyncio.sleep(2)
-    assert len(operator2_evt.elements_down_data) == 0, "проверить что второму пользователю не пришли уведомления " \
-                                                       "после действий первого пользователя"
+    await operator2_evt.assert_quiet()
+    assert operator2_evt.count() == 0, "проверить что второму пользователю не пришли уведомления " \
+                                       "после действий первого пользователя"
 
     # погасить свое и проверить что пришел false
     await group[0].connection[0].rpc("Auth.Connections.dropById", await get_current_uid_session(group[0].connection[0]))
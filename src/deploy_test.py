@@ -0,0 +1,88 @@
+import hashlib
+import json
+
+from common import DeployCache, clone_file, file_hash
+
+""" Кэш развертывания артефактов (DeployCache) и копирование файлов (clone_file) """
+
+
+class _NoReflink:
+    """ fcntl файловой системы без поддержки FICLONE """
+    @staticmethod
+    def ioctl(fd, request, arg):
+        raise OSError(95, "Operation not supported")
+
+
+def test_file_hash(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"x" * 3000000)  # больше одного блока чтения
+
+    assert file_hash(path) == hashlib.sha256(b"x" * 3000000).hexdigest()
+
+
+def test_clone_file_falls_back_to_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr("common.deploy.fcntl", _NoReflink)
+    src = tmp_path / "src.db"
+    dst = tmp_path / "dst.db"
+    src.write_bytes(b"database")
+    dst.write_bytes(b"old copy")
+
+    assert clone_file(src, dst) == "copy", "без reflink - обычное копирование"
+    assert dst.read_bytes() == b"database"
+
+    dst.write_bytes(b"changed")
+    assert src.read_bytes() == b"database", "копия независима от исходника"
+
+
+def test_clone_file_without_fcntl(tmp_path, monkeypatch):
+    monkeypatch.setattr("common.deploy.fcntl", None)
+    src = tmp_path / "src.db"
+    src.write_bytes(b"database")
+
+    assert clone_file(src, tmp_path / "dst.db") == "copy"
+    assert (tmp_path / "dst.db").read_bytes() == b"database"
+
+
+def test_deploy_cache_hit_and_miss(tmp_path):
+    source = tmp_path / "source"
+    work_dir = tmp_path / "work"
+    source.mkdir()
+    work_dir.mkdir()
+    src = source / "config.json"
+    src.write_text('{"a": 1}')
+
+    cache = DeployCache(work_dir)
+    assert cache.sync(src) is True, "первое развертывание - копирование"
+    assert cache.sync(src) is False, "файл не изменился - копирования нет"
+
+    manifest = json.loads((work_dir / DeployCache.MANIFEST).read_text())
+    assert manifest[str(src)]["hash"] == file_hash(src), "в манифесте хэш содержимого"
+
+    # новый экземпляр читает манифест с диска
+    assert DeployCache(work_dir).sync(src) is False
+
+    src.write_text('{"a": 2}')
+    assert DeployCache(work_dir).sync(src) is True, "содержимое изменилось - копирование"
+    assert (work_dir / "config.json").read_text() == '{"a": 2}'
+
+    (work_dir / "config.json").unlink()
+    assert DeployCache(work_dir).sync(src) is True, "копия удалена - копирование"
+
+
+def test_deploy_cache_deployed_copy_changed(tmp_path):
+    source = tmp_path / "source"
+    work_dir = tmp_path / "work"
+    source.mkdir()
+    work_dir.mkdir()
+    src = source / "auth.db"
+    src.write_bytes(b"pristine database")
+    deployed = work_dir / "auth.db"
+
+    cache = DeployCache(work_dir)
+    assert cache.sync(src) is True
+    assert cache.sync(src) is False
+
+    deployed.write_bytes(b"database changed by the service")  # сервис изменил развернутую копию
+    assert DeployCache(work_dir).sync(src) is True, "копия изменена - копирование"
+    assert deployed.read_bytes() == b"pristine database"
+    assert DeployCache(work_dir).sync(src) is False
@@ -0,0 +1,34 @@
+import pytest
+
+from common import LeakDetector, fit_slope
+
+""" Поиск утечек: оценка прироста (fit_slope) и параметры LeakDetector """
+
+
+def test_fit_slope():
+    xs = [0, 1, 2, 3, 4]
+    assert fit_slope(xs, [10, 12, 14, 16, 18]) == pytest.approx(2.0), "точная прямая"
+    assert fit_slope(xs, [5, 5, 5, 5, 5]) == pytest.approx(0.0), "без прироста"
+    assert fit_slope(xs, [1, 3, 2, 5, 4]) == pytest.approx(0.8), "шум вокруг прямой"
+    assert fit_slope(xs, [8, 6, 4, 2, 0]) == pytest.approx(-2.0), "убывание"
+
+
+def test_fit_slope_degenerate():
+    assert fit_slope([], []) == 0.0
+    assert fit_slope([1], [100]) == 0.0, "одна точка - прирост не определен"
+    assert fit_slope([2, 2, 2], [1, 2, 3]) == 0.0, "все x одинаковые"
+
+
+def test_leak_detector_arguments(main):
+    config = main
+    with pytest.raises(ValueError):
+        LeakDetector(config, pid=1, scenario="drop_group", iterations=1)
+    with pytest.raises(ValueError):
+        LeakDetector(config, pid=1, scenario="unknown", iterations=10)
+
+    assert LeakDetector(config, pid=1, scenario="login_logout", iterations=2).iterations == 2
+
+
+def test_leak_detector_unknown_user(main):
+    with pytest.raises(ValueError):
+        LeakDetector(main, pid=1, scenario="drop_group", iterations=10, user_name="no_such_user")
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from common import NotificationStream, LatencyHistogram
+
+""" Буфер уведомлений (NotificationStream): задержка доставки и окно тишины """
+
+
+def test_latency_first_after_mark(monkeypatch):
+    monkeypatch.setattr(NotificationStream, "RUN_LATENCY", LatencyHistogram())
+    stream = NotificationStream()
+
+    stream.on_event("Auth.Connections.Event.Down", [1])
+    assert stream.events[0].latency is None, "без отметки задержки нет"
+    assert stream.latency.count == 0
+
+    stream.mark()
+    for uid in (2, 3, 4):
+        stream.on_event("Auth.Connections.Event.Down", [uid])
+    assert stream.latency.count == 1, "записана только задержка первого уведомления после отметки"
+    assert NotificationStream.RUN_LATENCY.count == 1
+    assert all(notification.latency is not None for notification in stream.events[1:]), "от отметки mark()"
+    assert stream.events[3].latency >= stream.events[1].latency
+
+    stream.mark()
+    stream.on_event("Auth.Connections.Event.Down", [5])
+    assert stream.latency.count == 2
+
+
+async def test_wait_for():
+    stream = NotificationStream()
+    loop = asyncio.get_event_loop()
+    loop.call_later(0.01, stream.on_event, "Auth.Connections.Event.Up", {"uid": 1})
+    loop.call_later(0.02, stream.on_event, "Auth.Connections.Event.Down", [1])
+
+    matched = await stream.wait_for("Auth.Connections.Event.Down", timeout=1)
+    assert [notification.data for notification in matched] == [[1]]
+    assert stream.count() == 2
+
+
+def test_quiet_window(monkeypatch):
+    monkeypatch.setattr(NotificationStream, "RUN_LATENCY", LatencyHistogram())
+    for _ in range(NotificationStream.QUIET_MIN_SAMPLES - 1):
+        NotificationStream.RUN_LATENCY.record(0.001)
+    assert NotificationStream.quiet_window() == NotificationStream.QUIET_MAX_WINDOW, "мало замеров - максимум"
+
+    NotificationStream.RUN_LATENCY.record(0.001)
+    assert NotificationStream.quiet_window() == NotificationStream.QUIET_MIN_WINDOW, "быстрая доставка - нижняя граница"
+
+    for _ in range(100):
+        NotificationStream.RUN_LATENCY.record(0.3)
+    window = NotificationStream.quiet_window()
+    assert NotificationStream.QUIET_MIN_WINDOW < window <= NotificationStream.QUIET_MAX_WINDOW
+    assert window == min(NotificationStream.QUIET_FACTOR * NotificationStream.RUN_LATENCY.percentile(99),
+                         NotificationStream.QUIET_MAX_WINDOW)
+
+
+async def test_assert_quiet():
+    stream = NotificationStream()
+    await stream.assert_quiet(window=0.01)
+
+    asyncio.get_event_loop().call_later(0.01, stream.on_event, "Auth.Connections.Event.Down", [1])
+    with pytest.raises(AssertionError):  # уведомление в окне тишины
+        await stream.assert_quiet(window=0.5)
@@ -0,0 +1,72 @@
+from common import Connection, ConnectionPool
+
+""" Пул авторизованных соединений (ConnectionPool) """
+
+
+async def test_checkout_reuses_idle(main):
+    config = main
+    pool = ConnectionPool(config)
+    name = config.data.default_user.name
+    try:
+        connect = await pool.checkout(name)
+        assert await connect.rpc("Auth.User.whoami") == name, "соединение пула авторизовано"
+        assert connect.client not in Connection.REGISTRY.current(), "соединения пула не в REGISTRY"
+        await pool.checkin(connect)
+
+        async with pool.acquire(name) as again:
+            assert again is connect, "свободное соединение выдается повторно"
+        assert pool.stats == {"created": 1, "reused": 1, "evicted": 0}
+    finally:
+        await pool.close()
+
+
+async def test_checkout_evicts_broken(main):
+    config = main
+    pool = ConnectionPool(config)
+    name = config.data.default_user.name
+    try:
+        broken = await pool.checkout(name)
+        await pool.checkin(broken)
+        await broken.client.stop()  # соединение разорвано, пока лежит в пуле (как после service.reset)
+
+        connect = await pool.checkout(name)
+        assert connect is not broken, "сломанное соединение не выдается"
+        assert await connect.rpc("Auth.User.whoami") == name
+        assert pool.stats == {"created": 2, "reused": 0, "evicted": 1}
+        await pool.checkin(connect)
+    finally:
+        await pool.close()
+
+
+async def test_evict_and_max_idle(main):
+    config = main
+    pool = ConnectionPool(config, max_idle=1)
+    name = config.data.default_user.name
+    try:
+        first = await pool.checkout(name)
+        second = await pool.checkout(name)
+        pool.evict(first)
+        await pool.checkin(first)
+        assert pool.stats["evicted"] == 1, "evict: checkin закрывает соединение"
+
+        third = await pool.checkout(name)
+        assert third is not first
+        await pool.checkin(second)
+        await pool.checkin(third)  # сверх max_idle - закрывается
+
+        assert await pool.checkout(name) is second
+    finally:
+        await pool.close()
+
+
+async def test_close_releases_session_ids(main):
+    config = main
+    in_use = Connection.SESSION_IDS.in_use
+    pool = ConnectionPool(config)
+    connect = await pool.checkout(config.data.default_user.name)
+    await pool.checkin(connect)
+    Connection.SESSION_IDS.release_all()
+    assert Connection.SESSION_IDS.in_use >= 1, "идентификатор соединения пула закреплен"
+
+    await pool.close()
+    assert Connection.SESSION_IDS.in_use <= in_use, "close освобождает идентификаторы"
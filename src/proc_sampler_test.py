@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from common import ProcSampler
+
+""" Опрос /proc процесса (ProcSampler) """
+
+pytestmark = pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="нужен /proc (Linux)")
+
+
+def test_samples_are_bounded():
+    sampler = ProcSampler(os.getpid(), interval=1, max_samples=3)
+    first = sampler.mark()
+    for _ in range(4):
+        sampler.sample()
+
+    assert len(sampler.samples) == 3, "хранятся только последние max_samples снимков"
+    assert sampler.dropped == 2
+    assert first == 0
+
+    since = sampler.mark()
+    assert since == 5, "номер снимка сквозной, с учетом вытесненных"
+    assert sampler.summary(since)["samples"] == 2, "с отметки: снимок mark и снимок summary"
+    assert sampler.summary(first)["samples"] == 3, "вытесненная отметка - с самого старого снимка"
+
+
+def test_summary():
+    sampler = ProcSampler(os.getpid(), interval=1)
+    since = sampler.mark()
+    data = [bytearray(1024) for _ in range(1024)]  # немного работы между снимками
+    summary = sampler.summary(since)
+
+    assert data and summary["samples"] == 2
+    assert summary["cpu_s"] >= 0 and summary["wall_s"] >= 0
+    assert summary["rss_peak_kb"] > 0 and summary["threads_peak"] >= 1
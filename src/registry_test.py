@@ -0,0 +1,38 @@
+import gc
+
+from common import ConnectionRegistry
+
+""" Учет открытых клиентов по областям (ConnectionRegistry) """
+
+
+class _Client:
+    pass
+
+
+def test_keeps_client_until_discard():
+    registry = ConnectionRegistry()
+    registry.add(_Client())  # других ссылок на клиента нет
+    gc.collect()
+
+    assert len(registry) == 1, "брошенный без stop клиент остается в учете"
+    client = registry.current()[0]
+    registry.discard(client)
+    assert len(registry) == 0 and registry.current() == []
+
+
+def test_scopes():
+    registry = ConnectionRegistry()
+    fixture_client, test_client = _Client(), _Client()
+    registry.push("test")
+    registry.add(fixture_client)
+    registry.push("call")
+    registry.add(test_client)
+    assert registry.scope_name == "call"
+
+    assert registry.pop(merge=True) == [test_client], "pop вернет клиентов области"
+    assert registry.current() == [fixture_client, test_client], "merge - клиенты перешли в родительскую область"
+
+    assert registry.drain() == [fixture_client, test_client]
+    assert len(registry) == 0
+    assert registry.pop() == []
+    assert registry.scope_name == "root"
@@ -0,0 +1,115 @@
+import pytest
+
+from common import SessionIdAllocator, Connection
+
+""" Выдача идентификаторов сессий (client_id рукопожатия) """
+
+
+def test_allocate_by_kind():
+    allocator = SessionIdAllocator()
+
+    assert allocator.allocate("admin") == 3000, "первый идентификатор диапазона admin"
+    assert allocator.allocate("admin") == 3001
+    assert allocator.allocate("user") == 3100, "первый идентификатор диапазона user"
+    assert allocator.in_use == 3
+
+
+def test_release_reuses_id():
+    allocator = SessionIdAllocator()
+    first = allocator.allocate()
+    second = allocator.allocate()
+
+    allocator.release(first)
+    assert allocator.allocate() == first, "освобожденный идентификатор выдается повторно"
+    assert allocator.allocate() == second + 1
+
+
+def test_overflow():
+    allocator = SessionIdAllocator({"user": (1, 2)})
+    allocator.allocate()
+    allocator.allocate()
+
+    with pytest.raises(OverflowError):
+        allocator.allocate()
+
+
+def test_reserve_is_skipped_by_allocate():
+    allocator = SessionIdAllocator()
+    allocator.reserve(3100)
+    allocator.reserve(3101)
+
+    assert allocator.allocate() == 3102, "занятые вручную идентификаторы не выдаются"
+
+
+def test_reserve_in_use():
+    allocator = SessionIdAllocator()
+    session = allocator.allocate("admin")
+
+    with pytest.raises(ValueError):
+        allocator.reserve(session)
+    allocator.reserve(3100)
+    with pytest.raises(ValueError):
+        allocator.reserve(3100)
+
+    allocator.release(session)
+    allocator.reserve(session)  # освобожденный можно занять снова
+
+
+def test_pin_survives_release_all():
+    allocator = SessionIdAllocator()
+    pinned = allocator.allocate()
+    allocator.pin(pinned)
+    allocator.allocate()
+
+    allocator.release_all()
+    assert allocator.in_use == 1, "остался только закрепленный идентификатор"
+    assert allocator.allocate() == pinned + 1, "закрепленный идентификатор не выдается"
+
+    allocator.unpin(pinned)
+    assert allocator.in_use == 1
+    assert allocator.allocate() == pinned, "после unpin идентификатор снова свободен"
+
+
+def test_partition_per_worker():
+    count = 4
+    workers = [SessionIdAllocator() for _ in range(count)]
+    for index, allocator in enumerate(workers):
+        allocator.partition(index, count)
+
+    for kind in SessionIdAllocator.RANGES:
+        ranges = sorted(allocator.ranges[kind] for allocator in workers)
+        low, high = SessionIdAllocator.RANGES[kind]
+        assert ranges[0][0] == low, f"{kind}: первый воркер начинается с начала диапазона"
+        assert ranges[-1][1] <= high, f"{kind}: последний воркер не выходит за диапазон"
+        for (_, previous_high), (next_low, _) in zip(ranges, ranges[1:]):
+            assert next_low == previous_high + 1, f"{kind}: поддиапазоны воркеров не пересекаются"
+
+    assert workers[1].allocate("user") == workers[1].ranges["user"][0]
+
+
+def test_partition_too_many_workers():
+    with pytest.raises(ValueError):
+        SessionIdAllocator({"admin": (3000, 3001)}).partition(0, 3)
+
+
+async def test_connection_releases_id(main):
+    config = main
+    connect = Connection(kind="admin")
+    low, high = Connection.SESSION_IDS.ranges["admin"]
+    assert low <= connect.session <= high, "идентификатор админа из диапазона admin"
+
+    await connect.start(config.service.port)
+    await connect.login(config.data.default_user.name, config.data.default_user.password)
+    assert await connect.rpc("Auth.User.whoami") == config.data.default_user.name
+    in_use = Connection.SESSION_IDS.in_use
+    await connect.stop()
+
+    assert Connection.SESSION_IDS.in_use == in_use - 1, "stop освобождает идентификатор"
+
+
+async def test_stop_without_start_releases_id():
+    connect = Connection(kind="admin")
+    in_use = Connection.SESSION_IDS.in_use
+
+    await connect.stop()  # start не вызывался или упал - client is None
+    assert Connection.SESSION_IDS.in_use == in_use - 1, "идентификатор освобожден"
@@ -22,7 +22,7 @@ async def test_create_users(administrator_connect, close_all_connect):
     assert req_create is True, "Должно придти что пользователь создан"
 
     # Создать соединение пользователя
-    user1_conn = Connection(session=(3001 + 1))
+    user1_conn = Connection()
     await user1_conn.start(config.service.port)
     req_token = await user1_conn.login(config.data.users[0].name, config.data.users[0].password)
     assert req_token != "", "Проверить что пришел токен, не пустая строка"